@@ -1,14 +1,28 @@
-import os, locale, json, sqlite3, calendar
+import os, re, math, locale, json, sqlite3, calendar, time, threading
+import click
+from collections import OrderedDict
 from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
 from dateutil.relativedelta import relativedelta
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
+from dateutil.rrule import rrulestr
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, send_file, abort, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
-from functools import wraps
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from sqlalchemy import create_engine
+from functools import wraps, lru_cache
+from urllib.request import pathname2url
+import invoice_pdf
+import backup
+import holidays_se
 
 APP_NAME = os.getenv("APP_NAME","Freelancer Admin App")
 SECRET_KEY = os.getenv("SECRET_KEY","change-me-please")
 DEFAULT_VAT_PERCENT = int(os.getenv("DEFAULT_VAT_PERCENT","25"))
 TIMEZONE = os.getenv("APP_TIMEZONE","Europe/Stockholm")
+APP_TZ = ZoneInfo(TIMEZONE)
+INVOICE_WORKERS = int(os.getenv("INVOICE_WORKERS","0")) or None  # None = os.cpu_count()
+MULTI_TENANT = os.getenv("MULTI_TENANT","0") == "1"
+TENANT_POOL_SIZE = int(os.getenv("TENANT_POOL_SIZE","16"))  # bases utilisateur ouvertes en même temps par worker
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///freelancer.sqlite3'
@@ -18,27 +32,89 @@ app.secret_key = SECRET_KEY
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 config_dir = os.path.join(APP_ROOT, "config")
 data_dir = os.path.join(APP_ROOT, "data")
+tenants_dir = os.path.join(data_dir, "tenants")
 os.makedirs(data_dir, exist_ok=True)
 
-
-db = SQLAlchemy(app)
-
 # Absolute path for SQLite file used by ensure_schema
-db_path = os.path.join(app.root_path, 'freelancer.sqlite3')
-
+# (Flask-SQLAlchemy résout les chemins sqlite relatifs dans instance/)
+db_path = os.path.join(app.instance_path, 'freelancer.sqlite3')
+
+
+# ---------- Multi-tenant ----------
+# MULTI_TENANT=1 : chaque utilisateur a son dossier data/tenants/<nom>/ (base SQLite,
+# factures, sauvegardes, archives, jeton Google). La session SQLAlchemy choisit le
+# moteur de l'utilisateur connecté ; les moteurs ouverts forment un pool LRU borné.
+TENANT_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+_tenant_engines = OrderedDict()   # tenant -> Engine, du moins au plus récemment utilisé
+_tenant_ready = set()             # schéma vérifié dans ce processus
+_tenant_lock = threading.Lock()
+
+def current_tenant():
+    return g.get('tenant') if MULTI_TENANT and has_app_context() else None
+
+def tenant_db_path(tenant):
+    return os.path.join(tenants_dir, tenant, 'freelancer.sqlite3')
+
+def tenant_exists(tenant):
+    return bool(tenant and TENANT_RE.match(tenant) and os.path.exists(tenant_db_path(tenant)))
+
+def current_db_path():
+    tenant = current_tenant()
+    return tenant_db_path(tenant) if tenant else db_path
+
+def current_data_dir():
+    tenant = current_tenant()
+    return os.path.join(tenants_dir, tenant) if tenant else data_dir
+
+def data_subdir(name):
+    # invoices/, backups/, archive/ de l'utilisateur courant
+    return os.path.join(current_data_dir(), name)
+
+def tenant_engine(tenant):
+    with _tenant_lock:
+        engine = _tenant_engines.get(tenant)
+        if engine is not None:
+            _tenant_engines.move_to_end(tenant)
+            return engine
+        path = tenant_db_path(tenant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        engine = create_engine(f"sqlite:///{path}")
+        if tenant not in _tenant_ready:
+            db.metadata.create_all(engine)
+            ensure_schema(path, os.path.join(tenants_dir, tenant, 'archive'))
+            _tenant_ready.add(tenant)
+        _tenant_engines[tenant] = engine
+        while len(_tenant_engines) > TENANT_POOL_SIZE:
+            _, old = _tenant_engines.popitem(last=False)
+            old.dispose()  # connexions libres fermées ; celles en cours restent valides
+        return engine
+
+class TenantSession(FlaskSQLAlchemySession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = current_tenant() if bind is None else None
+        if tenant:
+            return tenant_engine(tenant)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def use_tenant(tenant):
+    # la carte d'identité de la session ne doit pas mélanger deux bases
+    db.session.close()
+    g.tenant = tenant
+    g.pop('settings', None)
+
+@app.before_request
+def bind_tenant():
+    if not MULTI_TENANT:
+        return
+    tenant = session.get('tenant')
+    if tenant and not tenant_exists(tenant):
+        session.clear(); tenant = None
+    g.tenant = tenant
+
+
+db = SQLAlchemy(app, session_options={"class_": TenantSession})
 
 
-try:
-    from google.oauth2.credentials import Credentials
-    from google_auth_oauthlib.flow import Flow
-    from googleapiclient.discovery import build
-    from google.auth.transport.requests import Request
-except Exception:
-    Credentials = None
-    Flow = None
-    build = None
-    Request = None
-
 
 try:
     locale.setlocale(locale.LC_TIME, 'en_US.UTF-8')
@@ -52,14 +128,27 @@ def today_str():
     return f"{day} {now.day:02d} {month} {now.year}"
 
 
-def days_inclusive(start_dt, end_dt):
-    start_date = start_dt.date()
-    end_date = end_dt.date()
-    return max(0, (end_date - start_date).days + 1)
+# ---------- Time helpers ----------
+# Les jobs gardent start_dt/end_dt en heure locale naïve (affichage, formulaires)
+# et start_ts/end_ts en epoch UTC (durées exactes, requêtes par plage d'entiers).
+def to_epoch(local_dt):
+    """datetime local naïf (APP_TIMEZONE) -> secondes epoch UTC."""
+    return int(local_dt.replace(tzinfo=APP_TZ).timestamp())
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts, APP_TZ).replace(tzinfo=None)
+
+def local_date(x):
+    # epoch UTC (int) ou datetime local naïf -> date du calendrier local
+    if isinstance(x, (int, float)):
+        return datetime.fromtimestamp(x, APP_TZ).date()
+    return x.date()
 
-def weeks_ceiling(start_dt, end_dt):
-    d = days_inclusive(start_dt, end_dt)
-    import math
+def days_inclusive(start, end):
+    return max(0, (local_date(end) - local_date(start)).days + 1)
+
+def weeks_ceiling(start, end):
+    d = days_inclusive(start, end)
     return 0 if d == 0 else math.ceil(d/7)
 
 class Settings(db.Model):
@@ -93,31 +182,33 @@ class Role(db.Model):
     active = db.Column(db.Boolean, default=True)
 
 
-
-def days_inclusive(start_dt, end_dt):
-    start_date = start_dt.date()
-    end_date = end_dt.date()
-    return max(0, (end_date - start_date).days + 1)
-
-def weeks_ceiling(start_dt, end_dt):
-    d = days_inclusive(start_dt, end_dt)
-    import math
-    return 0 if d == 0 else math.ceil(d/7)
-
 class Job(db.Model):
+    # AUTOINCREMENT : un id parti dans une archive annuelle n'est jamais réattribué
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
     start_dt = db.Column(db.DateTime, nullable=False)
     end_dt = db.Column(db.DateTime, nullable=False)
+    start_ts = db.Column(db.Integer, nullable=True, index=True)  # epoch UTC, rempli automatiquement
+    end_ts = db.Column(db.Integer, nullable=True, index=True)  # page Jobs : à venir / passés
     vat_percent = db.Column(db.Integer, default=DEFAULT_VAT_PERCENT)
     detail = db.Column(db.String(200), nullable=True)
     gcal_event_id = db.Column(db.String(256), nullable=True)
+    sync_uuid = db.Column(db.String(64), nullable=True, unique=True)  # jobs saisis hors ligne (idempotence)
+    series_id = db.Column(db.Integer, db.ForeignKey('job_series.id'), nullable=True)  # occurrence matérialisée d'une série
     client = db.relationship("Client", lazy=True)
     role = db.relationship("Role", lazy=True)
     @property
+    def start_epoch(self):
+        return self.start_ts if self.start_ts is not None else to_epoch(self.start_dt)
+    @property
+    def end_epoch(self):
+        return self.end_ts if self.end_ts is not None else to_epoch(self.end_dt)
+    @property
     def duration_hours(self):
-        h = (self.end_dt - self.start_dt).total_seconds()/3600.0
+        # sur epochs : une nuit du dernier dimanche d'octobre compte bien 1 h de plus
+        h = (self.end_epoch - self.start_epoch)/3600.0
         return max(0.0, h)
     @property
     def amount_sek(self):
@@ -128,22 +219,62 @@ class Job(db.Model):
         elif m == 'production':
             return self.role.rate_sek
         elif m == 'daily':
-            return self.role.rate_sek * days_inclusive(self.start_dt, self.end_dt)
+            return self.role.rate_sek * days_inclusive(self.start_epoch, self.end_epoch)
         elif m == 'weekly':
-            return self.role.rate_sek * weeks_ceiling(self.start_dt, self.end_dt)
+            return self.role.rate_sek * weeks_ceiling(self.start_epoch, self.end_epoch)
         else:
             return self.role.rate_sek
 
+@db.event.listens_for(Job, 'before_insert')
+@db.event.listens_for(Job, 'before_update')
+def job_set_epochs(mapper, connection, target):
+    target.start_ts = to_epoch(target.start_dt)
+    target.end_ts = to_epoch(target.end_dt)
+
+class JobSeries(db.Model):
+    # job récurrent stocké une seule fois (règle RRULE), développé à la demande en jobs
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
+    start_dt = db.Column(db.DateTime, nullable=False)  # première occurrence (heure locale)
+    end_dt = db.Column(db.DateTime, nullable=False)
+    rrule = db.Column(db.String(300), nullable=False)  # ex. FREQ=WEEKLY;BYDAY=FR;COUNT=12
+    until_ts = db.Column(db.Integer, nullable=True)    # epoch UTC après la dernière occurrence (NULL = sans fin)
+    materialized_until = db.Column(db.Integer, nullable=False, default=0)  # avant : occurrences enregistrées dans job
+    vat_percent = db.Column(db.Integer, default=DEFAULT_VAT_PERCENT)
+    detail = db.Column(db.String(200), nullable=True)
+    gcal_event_id = db.Column(db.String(256), nullable=True)  # un seul évènement récurrent
+    sync_uuid = db.Column(db.String(64), nullable=True, unique=True)
+    client = db.relationship("Client", lazy=True)
+    role = db.relationship("Role", lazy=True)
+
 class InvoiceStatus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
     year = db.Column(db.Integer, nullable=False)
     month = db.Column(db.Integer, nullable=False)
     sent = db.Column(db.Boolean, default=False)
+    sent_on = db.Column(db.Date, nullable=True)  # date d'envoi : point de départ de l'ancienneté
     paid = db.Column(db.Boolean, default=False)
     invoice_number = db.Column(db.String(120), nullable=True)
     client = db.relationship("Client", lazy=True)
 
+class JobYear(db.Model):
+    # index des années : compteurs tenus par triggers (job_count = base principale)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    job_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_count = db.Column(db.Integer, nullable=False, default=0)
+    archive_file = db.Column(db.String(500), nullable=True)
+
+class ChangeLog(db.Model):
+    # flux de modifications pour /api/sync : une seule ligne par entité (la plus récente)
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # 'upsert'|'delete'
+    changed_at = db.Column(db.Integer, nullable=False)
+
 class Holiday(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True)
@@ -156,39 +287,168 @@ def column_exists(cur, table, column):
     cur.execute(f"PRAGMA table_info({table})")
     return any(row[1] == column for row in cur.fetchall())
 
-def ensure_schema():
-    # Resolve DB path defensively
-    path = globals().get('db_path') or os.path.join(app.root_path, 'freelancer.sqlite3')
-    con = sqlite3.connect(path)
-    cur = con.cursor()
-    try:
-        cur.execute("PRAGMA foreign_keys=ON")
-        for (table, col, ddl) in [
-            ('settings','gcal_enabled',"ALTER TABLE settings ADD COLUMN gcal_enabled BOOLEAN DEFAULT 0"),
-            ('settings','gcal_calendar_id',"ALTER TABLE settings ADD COLUMN gcal_calendar_id VARCHAR(400)"),
-            ('invoice_status','invoice_number',"ALTER TABLE invoice_status ADD COLUMN invoice_number VARCHAR(120)"),
-            ('role','vat_percent',"ALTER TABLE role ADD COLUMN vat_percent INTEGER DEFAULT %d" % DEFAULT_VAT_PERCENT),
-            ('settings','favicon_url',"ALTER TABLE settings ADD COLUMN favicon_url VARCHAR(800)"),
-            ('settings','currency_code',"ALTER TABLE settings ADD COLUMN currency_code VARCHAR(8) DEFAULT 'SEK'"),
-        ]:
+# ---------- Full-text search (FTS5) ----------
+# job_fts indexe Job.detail + noms client/rôle ; rowid = job.id, tenu à jour par triggers.
+# Les jobs archivés restent indexés : pendant un déplacement vers/depuis une archive
+# (ligne dans archive_move), les triggers d'insertion/suppression ne font rien.
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS job_fts USING fts5(detail, client_name, role_name, start_ts UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS job_fts_ai AFTER INSERT ON job WHEN NOT EXISTS (SELECT 1 FROM archive_move) BEGIN
+        INSERT INTO job_fts(rowid, detail, client_name, role_name, start_ts) VALUES (new.id, coalesce(new.detail,''),
+            (SELECT name FROM client WHERE id=new.client_id), (SELECT name FROM role WHERE id=new.role_id), new.start_ts);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS job_fts_ad AFTER DELETE ON job WHEN NOT EXISTS (SELECT 1 FROM archive_move) BEGIN
+        DELETE FROM job_fts WHERE rowid=old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS job_fts_au AFTER UPDATE OF detail, client_id, role_id, start_ts ON job BEGIN
+        DELETE FROM job_fts WHERE rowid=old.id;
+        INSERT INTO job_fts(rowid, detail, client_name, role_name, start_ts) VALUES (new.id, coalesce(new.detail,''),
+            (SELECT name FROM client WHERE id=new.client_id), (SELECT name FROM role WHERE id=new.role_id), new.start_ts);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS client_fts_au AFTER UPDATE OF name ON client BEGIN
+        UPDATE job_fts SET client_name=new.name WHERE rowid IN (SELECT id FROM job WHERE client_id=new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS role_fts_au AFTER UPDATE OF name ON role BEGIN
+        UPDATE job_fts SET role_name=new.name WHERE rowid IN (SELECT id FROM job WHERE role_id=new.id);
+    END""",
+]
+
+# jobs de la base principale absents de l'index (premier démarrage, archive restaurée...)
+FTS_INDEX_MISSING = """INSERT INTO job_fts(rowid, detail, client_name, role_name, start_ts)
+    SELECT job.id, coalesce(job.detail,''), client.name, role.name, job.start_ts
+    FROM job LEFT JOIN client ON client.id=job.client_id LEFT JOIN role ON role.id=job.role_id
+    WHERE job.id NOT IN (SELECT rowid FROM job_fts)"""
+
+def ensure_search_index(cur, archive_dir):
+    # index d'avant start_ts / archive_move : table et triggers recréés, archives existantes réindexées
+    rebuild = column_exists(cur, 'job_fts', 'detail') and not column_exists(cur, 'job_fts', 'start_ts')
+    if rebuild:
+        for name in ('job_fts_ai', 'job_fts_ad', 'job_fts_au'):
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute("DROP TABLE job_fts")
+    for ddl in SEARCH_DDL:
+        cur.execute(ddl)
+    # pas de reconstruction complète : les lignes des jobs archivés doivent rester
+    cur.execute(FTS_INDEX_MISSING)
+    if rebuild:
+        cur.connection.commit()  # ATTACH impossible dans une transaction
+        for (year,) in cur.execute("SELECT year FROM job_year WHERE archived_count > 0").fetchall():
+            path = os.path.join(archive_dir, f"jobs-{year}.sqlite3")
+            if not os.path.exists(path):
+                continue
+            cur.execute("ATTACH DATABASE ? AS arch", (path,))
             try:
-                if not column_exists(cur, table, col):
-                    cur.execute(ddl)
-            except sqlite3.OperationalError:
-                pass
+                cur.execute("""INSERT INTO job_fts(rowid, detail, client_name, role_name, start_ts)
+                               SELECT job.id, coalesce(job.detail,''), client.name, role.name, job.start_ts
+                               FROM arch.job AS job LEFT JOIN client ON client.id=job.client_id
+                               LEFT JOIN role ON role.id=job.role_id""")
+                cur.connection.commit()
+            finally:
+                cur.execute("DETACH DATABASE arch")
+
+# ---------- Year index (job_year) ----------
+JOB_YEAR_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS job_year_ai AFTER INSERT ON job BEGIN
+        INSERT INTO job_year(year, job_count, archived_count) VALUES (CAST(strftime('%Y', new.start_dt) AS INTEGER), 1, 0)
+            ON CONFLICT(year) DO UPDATE SET job_count = job_count + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS job_year_ad AFTER DELETE ON job BEGIN
+        UPDATE job_year SET job_count = job_count - 1 WHERE year = CAST(strftime('%Y', old.start_dt) AS INTEGER);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS job_year_au AFTER UPDATE OF start_dt ON job BEGIN
+        UPDATE job_year SET job_count = job_count - 1 WHERE year = CAST(strftime('%Y', old.start_dt) AS INTEGER);
+        INSERT INTO job_year(year, job_count, archived_count) VALUES (CAST(strftime('%Y', new.start_dt) AS INTEGER), 1, 0)
+            ON CONFLICT(year) DO UPDATE SET job_count = job_count + 1;
+    END""",
+]
+
+def ensure_year_index(cur):
+    for ddl in JOB_YEAR_DDL:
+        cur.execute(ddl)
+    # premier démarrage avec l'index : un seul scan pour l'initialiser
+    if cur.execute("SELECT count(*) FROM job_year").fetchone()[0] == 0:
+        cur.execute("""INSERT INTO job_year(year, job_count, archived_count)
+                       SELECT CAST(strftime('%Y', start_dt) AS INTEGER), count(*), 0 FROM job GROUP BY 1""")
+
+# ---------- Change log (delta sync) ----------
+SYNC_ENTITIES = ['client', 'role', 'job']
+
+def change_log_ddl(table):
+    log = (f"DELETE FROM change_log WHERE entity='{table}' AND entity_id={{row}}.id; "
+           f"INSERT INTO change_log(entity, entity_id, op, changed_at) VALUES ('{table}', {{row}}.id, '{{op}}', CAST(strftime('%s','now') AS INTEGER));")
+    # archivage/restauration d'une année (ligne dans archive_move) : rien à publier, le job n'a pas changé
+    moving = "WHEN NOT EXISTS (SELECT 1 FROM archive_move)"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_log_ai AFTER INSERT ON {table} {moving} BEGIN {log.format(row='new', op='upsert')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_log_au AFTER UPDATE ON {table} BEGIN {log.format(row='new', op='upsert')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_log_ad AFTER DELETE ON {table} {moving} BEGIN {log.format(row='old', op='delete')} END",
+    ]
+
+def ensure_change_log(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_change_log_entity ON change_log(entity, entity_id)")
+    for table in SYNC_ENTITIES:
+        # triggers d'avant archive_move : recréés
+        for name in (f"{table}_log_ai", f"{table}_log_ad"):
+            row = cur.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (name,)).fetchone()
+            if row and "archive_move" not in row[0]:
+                cur.execute(f"DROP TRIGGER {name}")
+        for ddl in change_log_ddl(table):
+            cur.execute(ddl)
+    # base existante : toutes les lignes actuelles deviennent des 'upsert' initiaux
+    if cur.execute("SELECT count(*) FROM change_log").fetchone()[0] == 0:
+        for table in SYNC_ENTITIES:
+            cur.execute(f"""INSERT INTO change_log(entity, entity_id, op, changed_at)
+                            SELECT '{table}', id, 'upsert', CAST(strftime('%s','now') AS INTEGER) FROM {table} ORDER BY id""")
+
+def ensure_job_autoincrement(cur):
+    # bases d'avant les archives : job.id sans AUTOINCREMENT -> table reconstruite à l'identique
+    ddl = cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='job'").fetchone()[0]
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    con = cur.connection
+    con.commit()
+    cur.execute("PRAGMA foreign_keys=OFF")
+    fks = {r[3]: (r[2], r[4]) for r in cur.execute("PRAGMA foreign_key_list(job)").fetchall()}
+    cols = cur.execute("PRAGMA table_info(job)").fetchall()  # cid, name, type, notnull, dflt, pk
+    defs = []
+    for _, name, typ, notnull, dflt, pk in cols:
+        if pk:
+            defs.append(f"{name} INTEGER PRIMARY KEY AUTOINCREMENT")
+            continue
+        d = f"{name} {typ}" + (" NOT NULL" if notnull else "") + (f" DEFAULT {dflt}" if dflt is not None else "")
+        if name in fks:
+            d += f" REFERENCES {fks[name][0]} ({fks[name][1]})"
+        defs.append(d)
+    names = ", ".join(c[1] for c in cols)
+    try:
+        # index et triggers partent avec l'ancienne table ; ensure_schema les recrée ensuite
+        cur.execute("BEGIN")
+        cur.execute(f"CREATE TABLE job_autoinc ({', '.join(defs)})")
+        cur.execute(f"INSERT INTO job_autoinc ({names}) SELECT {names} FROM job")
+        cur.execute("DROP TABLE job")
+        # les triggers FTS de client/role citent job : renommage sans réécriture ni vérification
+        cur.execute("PRAGMA legacy_alter_table=ON")
+        cur.execute("ALTER TABLE job_autoinc RENAME TO job")
         con.commit()
+    except Exception:
+        con.rollback()
+        raise
     finally:
-        con.close()
-
-
-# ---------- Auto-migration ----------
-def column_exists(cur, table, column):
-    cur.execute(f"PRAGMA table_info({table})")
-    return any(row[1] == column for row in cur.fetchall())
+        cur.execute("PRAGMA legacy_alter_table=OFF")
+        cur.execute("PRAGMA foreign_keys=ON")
 
-def ensure_schema():
-    # Resolve DB path defensively
-    path = globals().get('db_path') or os.path.join(app.root_path, 'freelancer.sqlite3')
+def backfill_job_epochs(cur):
+    # jobs créés avant l'ajout de start_ts/end_ts (heure locale naïve -> epoch UTC)
+    rows = cur.execute("SELECT id, start_dt, end_dt FROM job WHERE start_ts IS NULL OR end_ts IS NULL").fetchall()
+    cur.executemany("UPDATE job SET start_ts=?, end_ts=? WHERE id=?", [
+        (to_epoch(datetime.fromisoformat(sd)), to_epoch(datetime.fromisoformat(ed)), jid)
+        for jid, sd, ed in rows
+    ])
+
+def ensure_schema(path=None, archive_dir=None):
+    path = path or current_db_path()
+    archive_dir = archive_dir or data_subdir("archive")
     con = sqlite3.connect(path)
     cur = con.cursor()
     try:
@@ -197,15 +457,37 @@ def ensure_schema():
             ('settings','gcal_enabled',"ALTER TABLE settings ADD COLUMN gcal_enabled BOOLEAN DEFAULT 0"),
             ('settings','gcal_calendar_id',"ALTER TABLE settings ADD COLUMN gcal_calendar_id VARCHAR(400)"),
             ('invoice_status','invoice_number',"ALTER TABLE invoice_status ADD COLUMN invoice_number VARCHAR(120)"),
+            ('invoice_status','sent_on',"ALTER TABLE invoice_status ADD COLUMN sent_on DATE"),
             ('role','vat_percent',"ALTER TABLE role ADD COLUMN vat_percent INTEGER DEFAULT %d" % DEFAULT_VAT_PERCENT),
             ('settings','favicon_url',"ALTER TABLE settings ADD COLUMN favicon_url VARCHAR(800)"),
             ('settings','currency_code',"ALTER TABLE settings ADD COLUMN currency_code VARCHAR(8) DEFAULT 'SEK'"),
+            ('job','start_ts',"ALTER TABLE job ADD COLUMN start_ts INTEGER"),
+            ('job','end_ts',"ALTER TABLE job ADD COLUMN end_ts INTEGER"),
+            ('job','sync_uuid',"ALTER TABLE job ADD COLUMN sync_uuid VARCHAR(64)"),
+            ('job','series_id',"ALTER TABLE job ADD COLUMN series_id INTEGER REFERENCES job_series(id)"),
         ]:
             try:
                 if not column_exists(cur, table, col):
                     cur.execute(ddl)
             except sqlite3.OperationalError:
                 pass
+        ensure_job_autoincrement(cur)
+        # marqueur « déplacement d'archive en cours », lu par les triggers (une ligne le temps de la transaction)
+        cur.execute("CREATE TABLE IF NOT EXISTS archive_move (year INTEGER NOT NULL)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_job_start_ts ON job(start_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_job_end_ts ON job(end_ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_invoice_status_period ON invoice_status(client_id, year, month)")
+        backfill_job_epochs(cur)
+        ensure_year_index(cur)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_job_sync_uuid ON job(sync_uuid)")
+        # une occurrence de série n'est enregistrée qu'une fois, même si deux workers matérialisent
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_job_series_occurrence ON job(series_id, start_ts)")
+        ensure_change_log(cur)
+        try:
+            ensure_search_index(cur, archive_dir)
+        except sqlite3.OperationalError as e:
+            # SQLite compilé sans FTS5 : la recherche sera simplement indisponible
+            app.logger.warning("Search index unavailable: %s", e)
         con.commit()
     finally:
         con.close()
@@ -230,6 +512,13 @@ def parse_percent(val, default):
         return default
 
 def get_settings():
+    # une seule lecture par requête (et par utilisateur en multi-tenant)
+    if has_app_context() and 'settings' in g:
+        return g.settings
+    if MULTI_TENANT and not current_tenant():
+        # page de connexion : pas encore de base utilisateur, valeurs par défaut non enregistrées
+        return Settings(company_logo_url=None, favicon_url=None, login_enabled=True, currency_code='SEK',
+                        night_start_hour=0, night_end_hour=8, net_rate_percent=70.0)
     s = Settings.query.first()
     if not s:
         s = Settings(
@@ -245,11 +534,13 @@ def get_settings():
             currency_code='SEK'
         )
         db.session.add(s); db.session.commit()
+    if has_app_context():
+        g.settings = s
     return s
 
 @app.context_processor
 def inject_globals():
-    return {"settings": get_settings()}
+    return {"settings": get_settings(), "multi_tenant": MULTI_TENANT, "tenant": current_tenant()}
 
 @app.template_filter('fmt_money')
 def fmt_money(value):
@@ -260,11 +551,16 @@ def fmt_money(value):
     except Exception:
         return value
 
+MONTH_NAMES = ['','January','February','March','April','May','June','July','August','September','October','November','December']
+
 def month_bounds(year:int, month:int):
     start = datetime(year, month, 1)
     end = start + relativedelta(months=1)
     return start, end
 
+def job_vat_percent(j):
+    return j.role.vat_percent if j.role and j.role.vat_percent is not None else j.vat_percent
+
 def get_invoice_status(client_id:int, year:int, month:int):
     rec = InvoiceStatus.query.filter_by(client_id=client_id, year=year, month=month).first()
     if not rec:
@@ -272,6 +568,395 @@ def get_invoice_status(client_id:int, year:int, month:int):
         db.session.add(rec); db.session.commit()
     return rec
 
+def month_jobs_by_client(year:int, month:int):
+    start, end = month_bounds(year, month)
+    by_client = {}
+    for j in jobs_in_range(to_epoch(start), to_epoch(end)):
+        by_client.setdefault(j.client_id, []).append(j)
+    return by_client
+
+def invoice_payload(client, items, year:int, month:int):
+    """Données d'une facture client/mois sous forme de dict simple (pour invoice_pdf)."""
+    s = get_settings()
+    status = get_invoice_status(client.id, year, month)
+    lines = []
+    for j in items:
+        lines.append({
+            "date": j.start_dt.strftime('%Y-%m-%d'),
+            "role": j.role.name if j.role else "",
+            "mode": j.role.mode if j.role else None,
+            "rate": j.role.rate_sek if j.role else 0.0,
+            "detail": j.detail or "",
+            "hours": round(j.duration_hours, 2),
+            "days": days_inclusive(j.start_epoch, j.end_epoch),
+            "weeks": weeks_ceiling(j.start_epoch, j.end_epoch),
+            "vat_percent": job_vat_percent(j),
+            "amount": round(j.amount_sek, 2),
+        })
+    ht = sum(l["amount"] for l in lines)
+    vat = sum(l["amount"] * l["vat_percent"] / 100.0 for l in lines)
+    return {
+        "company": APP_NAME, "client": client.name, "client_id": client.id,
+        "year": year, "month": month, "period": f"{MONTH_NAMES[month]} {year}",
+        "invoice_number": status.invoice_number, "currency": s.currency_code or 'SEK',
+        "issued": date.today().isoformat(), "lines": lines,
+        "ht": round(ht, 2), "vat": round(vat, 2), "gross": round(ht + vat, 2),
+    }
+
+# ---------- Holiday calendar (in-memory) ----------
+# date -> (name, surcharge_text). TTL court pour que les autres workers gunicorn
+# voient les modifications ; le worker qui modifie invalide immédiatement.
+HOLIDAY_CACHE_TTL = 60
+_holiday_caches = {}  # tenant (None = base unique) -> {"loaded", "table"}
+
+def holiday_table():
+    cache = _holiday_caches.setdefault(current_tenant(), {"loaded": 0.0, "table": {}})
+    now = time.monotonic()
+    if not cache["loaded"] or now - cache["loaded"] > HOLIDAY_CACHE_TTL:
+        rows = db.session.execute(db.select(Holiday.date, Holiday.name, Holiday.surcharge_text)).all()
+        cache["table"] = {d: (name, sur) for d, name, sur in rows}
+        cache["loaded"] = now
+    return cache["table"]
+
+def invalidate_holiday_cache():
+    _holiday_caches.pop(current_tenant(), None)
+
+def holiday_on(d):
+    return holiday_table().get(d)
+
+def upsert_holidays(rows):
+    """Insère/renomme des (date, nom) en une seule transaction ; garde surcharge_text."""
+    from sqlalchemy.dialects.sqlite import insert
+    # deux fêtes le même jour : un seul INSERT ... ON CONFLICT ne garderait que la dernière
+    values = [{"date": d, "name": name} for d, name in holidays_se.merge_same_day(rows)]
+    if not values:
+        return 0
+    stmt = insert(Holiday.__table__).values(values)
+    stmt = stmt.on_conflict_do_update(index_elements=['date'], set_={"name": stmt.excluded.name})
+    db.session.execute(stmt)
+    db.session.commit()
+    invalidate_holiday_cache()
+    return len(values)
+
+# ---------- Yearly archives ----------
+# Une année close (toutes factures payées) peut être déplacée dans data/archive/jobs-AAAA.sqlite3.
+# job_year sait quelles années sont archivées ; jobs_in_range lit la bonne partition.
+JOB_COLUMNS = ['id', 'client_id', 'role_id', 'start_dt', 'end_dt', 'start_ts', 'end_ts', 'vat_percent', 'detail', 'gcal_event_id']
+
+def archive_path(year:int):
+    return os.path.join(data_subdir("archive"), f"jobs-{year}.sqlite3")
+
+def job_years():
+    rows = JobYear.query.filter(db.or_(JobYear.job_count > 0, JobYear.archived_count > 0)).order_by(JobYear.year.asc()).all()
+    return [r.year for r in rows]
+
+def archived_years_between(start_ts:int, end_ts:int):
+    y0, y1 = from_epoch(start_ts).year, from_epoch(end_ts - 1).year
+    return [r.year for r in JobYear.query.filter(JobYear.year >= y0, JobYear.year <= y1, JobYear.archived_count > 0)]
+
+def archived_jobs(year:int, start_ts:int, end_ts:int):
+    """Jobs d'une partition archivée, sous forme d'objets Job détachés (lecture seule)."""
+    return _read_archive(year, "start_ts >= ? AND start_ts < ? ORDER BY start_ts", (start_ts, end_ts))
+
+def archived_jobs_by_id(ids):
+    """{id: Job} des jobs archivés parmi `ids` (résultats de recherche)."""
+    years = [r.year for r in JobYear.query.filter(JobYear.archived_count > 0)]
+    out = {}
+    for y in years:
+        for j in _read_archive(y, f"id IN ({', '.join('?' * len(ids))})", list(ids)):
+            out[j.id] = j
+    return out
+
+def _read_archive(year, where, params):
+    path = archive_path(year)
+    if not os.path.exists(path):
+        return []
+    con = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True)
+    try:
+        rows = con.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM job WHERE {where}", params).fetchall()
+    finally:
+        con.close()
+    out = []
+    for row in rows:
+        j = Job(**dict(zip(JOB_COLUMNS, row)))
+        j.start_dt = datetime.fromisoformat(j.start_dt); j.end_dt = datetime.fromisoformat(j.end_dt)
+        j.client = db.session.get(Client, j.client_id)
+        j.role = db.session.get(Role, j.role_id)
+        out.append(j)
+    return out
+
+def jobs_in_range(start_ts:int, end_ts:int):
+    """Jobs dont le début est dans [start_ts, end_ts), base principale + années archivées."""
+    jobs = Job.query.filter(Job.start_ts >= start_ts, Job.start_ts < end_ts).order_by(Job.start_ts.asc()).all()
+    archived = [j for y in archived_years_between(start_ts, end_ts) for j in archived_jobs(y, start_ts, end_ts)]
+    virtual = series_jobs(start_ts, end_ts)
+    if archived or virtual:
+        jobs = sorted(jobs + archived + virtual, key=lambda j: j.start_ts)
+    return jobs
+
+def unpaid_months(year:int):
+    # (client, mois) ayant des jobs dans l'année sans facture marquée payée
+    sql = """SELECT count(*) FROM (
+                 SELECT DISTINCT client_id, CAST(strftime('%m', start_dt) AS INTEGER) AS month
+                 FROM job WHERE start_ts >= :y0 AND start_ts < :y1) AS m
+             LEFT JOIN invoice_status inv ON inv.client_id = m.client_id AND inv.year = :year AND inv.month = m.month
+             WHERE COALESCE(inv.paid, 0) = 0"""
+    return db.session.execute(db.text(sql), {"year": year, "y0": to_epoch(datetime(year,1,1)),
+                                             "y1": to_epoch(datetime(year+1,1,1))}).scalar()
+
+def _move_jobs(year:int, to_archive:bool):
+    path = archive_path(year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    y0, y1 = to_epoch(datetime(year,1,1)), to_epoch(datetime(year+1,1,1))
+    db.session.commit()
+    con = sqlite3.connect(current_db_path(), timeout=30, isolation_level=None)
+    try:
+        con.execute("ATTACH DATABASE ? AS arch", (path,))
+        ddl = con.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name='job'").fetchone()[0]
+        con.execute(re.sub(r"^CREATE TABLE \"?job\"?", "CREATE TABLE IF NOT EXISTS arch.job", ddl))
+        # la partition peut dater d'un schéma plus ancien : colonnes manquantes ajoutées
+        main_cols = [(r[1], r[2]) for r in con.execute("PRAGMA main.table_info(job)")]
+        arch_cols = {r[1] for r in con.execute("PRAGMA arch.table_info(job)")}
+        for name, typ in main_cols:
+            if name not in arch_cols:
+                con.execute(f"ALTER TABLE arch.job ADD COLUMN {name} {typ}")
+        cols = ", ".join(name for name, _ in main_cols)
+        src, dst = ("main", "arch") if to_archive else ("arch", "main")
+        if not to_archive:
+            # archive faite avant AUTOINCREMENT : ses ids ont pu être repris par de nouveaux jobs
+            clash = con.execute("SELECT count(*) FROM arch.job a JOIN main.job m ON m.id = a.id").fetchone()[0]
+            if clash:
+                raise ValueError(f"{year}: {clash} archived job ids are now used by newer jobs; "
+                                 "the archive cannot be restored automatically.")
+        has_fts = con.execute("SELECT 1 FROM main.sqlite_master WHERE name='job_fts'").fetchone()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # pas une suppression/création pour les triggers : l'index de recherche garde ces jobs
+            con.execute("INSERT INTO main.archive_move(year) VALUES (?)", (year,))
+            con.execute(f"INSERT INTO {dst}.job ({cols}) SELECT {cols} FROM {src}.job WHERE start_ts >= ? AND start_ts < ?", (y0, y1))
+            moved = con.execute(f"DELETE FROM {src}.job WHERE start_ts >= ? AND start_ts < ?", (y0, y1)).rowcount
+            if to_archive:
+                con.execute("UPDATE job_year SET archived_count = archived_count + ?, archive_file = ? WHERE year = ?",
+                            (moved, os.path.basename(path), year))
+            else:
+                con.execute("UPDATE job_year SET archived_count = 0, archive_file = NULL WHERE year = ?", (year,))
+                if has_fts:
+                    con.execute(FTS_INDEX_MISSING)  # archive créée avant que l'index ne garde ses lignes
+            con.execute("DELETE FROM main.archive_move")
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("DETACH DATABASE arch")
+        if moved:
+            con.execute("VACUUM")
+    finally:
+        con.close()
+    if not to_archive:
+        os.remove(path)
+    return moved
+
+def archive_year(year:int):
+    """Déplace les jobs d'une année close vers sa partition ; retourne le nombre de jobs déplacés."""
+    if year >= datetime.now().year:
+        raise ValueError(f"{year} is not closed yet.")
+    if unpaid_months(year):
+        raise ValueError(f"{year} still has unpaid invoices.")
+    return _move_jobs(year, to_archive=True)
+
+def unarchive_year(year:int):
+    if not os.path.exists(archive_path(year)):
+        raise ValueError(f"No archive for {year}.")
+    return _move_jobs(year, to_archive=False)
+
+# ---------- Recurring series ----------
+# Une série = une ligne job_series. Ses occurrences sont calculées à la volée (objets Job
+# non enregistrés) pour la page Jobs, le mensuel et les statistiques ; seules celles déjà
+# commencées, ou demandées explicitement, sont enregistrées dans job (en un seul INSERT).
+SERIES_HORIZON_DAYS = 90       # occurrences à venir affichées sur la page Jobs
+SERIES_CATCHUP_TTL = 60        # secondes entre deux matérialisations des occurrences passées
+REPEAT_RULES = {'daily': 'FREQ=DAILY', 'weekly': 'FREQ=WEEKLY', 'biweekly': 'FREQ=WEEKLY;INTERVAL=2',
+                'monthly': 'FREQ=MONTHLY'}
+SERIES_FREQS = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')  # pas de HOURLY/MINUTELY/SECONDLY
+SERIES_MAX_COUNT = 500         # occurrences max. (COUNT, et occurrences passées saisies d'un coup)
+SERIES_MAX_YEARS = 10          # UNTIL au plus 10 ans après le début de la série
+_series_catchup = {}  # tenant -> dernier passage (time.monotonic)
+
+@lru_cache(maxsize=256)
+def parse_rule(rule, dtstart):
+    # cache=True : les appels successifs à between() réutilisent les occurrences déjà calculées
+    return rrulestr(rule, dtstart=dtstart, cache=True)
+
+def normalize_rule(rule, dtstart):
+    """Règle RRULE nettoyée (sans préfixe « RRULE: ») ; ValueError si invalide ou hors limites."""
+    rule = re.sub(r"^RRULE:", "", (rule or "").strip().upper())
+    parts = dict(p.split("=", 1) for p in rule.split(";") if "=" in p)
+    if parts.get("FREQ") not in SERIES_FREQS:
+        raise ValueError(f"Invalid repeat rule: {rule!r} (FREQ must be one of {', '.join(SERIES_FREQS)})")
+    try:
+        rrulestr(rule, dtstart=dtstart)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid repeat rule: {rule!r} ({e})")
+    if "COUNT" in parts and int(parts["COUNT"]) > SERIES_MAX_COUNT:
+        raise ValueError(f"A series can have at most {SERIES_MAX_COUNT} occurrences.")
+    until = rule_until(rule)
+    if until and until > dtstart + relativedelta(years=SERIES_MAX_YEARS):
+        raise ValueError(f"A series can run for at most {SERIES_MAX_YEARS} years.")
+    return rule
+
+def rule_until(rule):
+    # UNTIL de la règle (heure locale ; une date seule = début de journée), None si absent
+    value = dict(p.split("=", 1) for p in rule.split(";") if "=" in p).get("UNTIL")
+    if not value:
+        return None
+    return datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S" if "T" in value else "%Y%m%d")
+
+def repeat_rule(repeat, until=None, count=None):
+    # formulaire -> RRULE ; UNTIL en heure locale, fin de journée incluse
+    rule = REPEAT_RULES[repeat]
+    if count:
+        rule += f";COUNT={int(count)}"
+    elif until:
+        rule += f";UNTIL={until:%Y%m%d}T235959"
+    return rule
+
+def describe_rule(rule):
+    parts = dict(p.split("=", 1) for p in rule.split(";") if "=" in p)
+    freq = parts.get("FREQ", "").lower()
+    n = int(parts.get("INTERVAL", 1))
+    unit = {"daily": "day", "weekly": "week", "monthly": "month", "yearly": "year"}.get(freq, freq)
+    text = f"every {unit}" if n == 1 else f"every {n} {unit}s"
+    if "BYDAY" in parts:
+        text += " on " + parts["BYDAY"].replace(",", ", ")
+    if "COUNT" in parts:
+        text += f", {parts['COUNT']} times"
+    elif "UNTIL" in parts:
+        text += f", until {parts['UNTIL'][:4]}-{parts['UNTIL'][4:6]}-{parts['UNTIL'][6:8]}"
+    return text
+
+def flagged_detail(detail, holiday, night):
+    flags = (["holiday"] if holiday else []) + (["night hours"] if night else [])
+    if not flags:
+        return detail
+    return (detail + " " if detail else "") + "(" + " & ".join(flags) + ")"
+
+def series_occurrences(series, start_ts, end_ts):
+    """(début, fin, détail) des occurrences non matérialisées commençant dans [start_ts, end_ts)."""
+    lo = max(start_ts, series.materialized_until or 0)
+    hi = min(end_ts, series.until_ts) if series.until_ts else end_ts
+    if lo >= hi:
+        return []
+    duration = series.end_dt - series.start_dt  # durée « murale » : 20:00-23:00 reste 20:00-23:00 après un changement d'heure
+    s = get_settings()
+    # même heure de début et même durée pour toutes les occurrences : une seule boucle nuit
+    night = overlaps_night(series.start_dt, series.end_dt, s.night_start_hour, s.night_end_hour)
+    out = []
+    for dt in parse_rule(series.rrule, series.start_dt).between(from_epoch(lo), from_epoch(hi), inc=True):
+        if lo <= to_epoch(dt) < hi:
+            out.append((dt, dt + duration, flagged_detail(series.detail, holiday_on(dt.date()), night)))
+    return out
+
+def series_jobs(start_ts:int, end_ts:int):
+    """Occurrences virtuelles (Job non enregistrés, id=None) de toutes les séries dans [start_ts, end_ts)."""
+    active = JobSeries.query.filter(JobSeries.start_dt < from_epoch(end_ts),
+                                    JobSeries.materialized_until < end_ts,
+                                    db.or_(JobSeries.until_ts.is_(None), JobSeries.until_ts > start_ts)).all()
+    out = []
+    for sr in active:
+        for start_dt, end_dt, detail in series_occurrences(sr, start_ts, end_ts):
+            j = Job(client_id=sr.client_id, role_id=sr.role_id, start_dt=start_dt, end_dt=end_dt,
+                    start_ts=to_epoch(start_dt), end_ts=to_epoch(end_dt), vat_percent=sr.vat_percent,
+                    detail=detail, series_id=sr.id)
+            j.client = sr.client; j.role = sr.role
+            out.append(j)
+    return out
+
+def materialize_series(series, until_ts:int):
+    """Enregistre dans job les occurrences commençant avant `until_ts`, en une transaction."""
+    occ = series_occurrences(series, series.materialized_until or 0, until_ts)
+    rows = [{"client_id": series.client_id, "role_id": series.role_id, "start_dt": start_dt, "end_dt": end_dt,
+             "start_ts": to_epoch(start_dt), "end_ts": to_epoch(end_dt), "vat_percent": series.vat_percent,
+             "detail": detail, "series_id": series.id,
+             "gcal_event_id": gcal_instance_id(series.gcal_event_id, start_dt) if series.gcal_event_id else None}
+            for start_dt, end_dt, detail in occ]
+    if rows:
+        # insertion groupée (pas d'évènement Google par job) ; OR IGNORE : un autre worker a pu passer avant
+        db.session.execute(Job.__table__.insert().prefix_with("OR IGNORE"), rows)
+    series.materialized_until = max(series.materialized_until or 0, until_ts)
+    db.session.commit()
+    return len(rows)
+
+def materialize_due_series():
+    """Matérialise les occurrences déjà commencées (factures, relances, recherche, synchro)."""
+    now_ts = int(time.time())
+    due = JobSeries.query.filter(JobSeries.materialized_until < now_ts, JobSeries.start_dt <= from_epoch(now_ts),
+                                 db.or_(JobSeries.until_ts.is_(None),
+                                        JobSeries.materialized_until < JobSeries.until_ts)).all()
+    return sum(materialize_series(sr, now_ts) for sr in due)
+
+@app.before_request
+def series_catchup():
+    if request.endpoint in (None, 'static', 'healthz', 'service_worker'):
+        return
+    if MULTI_TENANT and not current_tenant():
+        return
+    now = time.monotonic()
+    last = _series_catchup.get(current_tenant())
+    if last and now - last < SERIES_CATCHUP_TTL:
+        return
+    _series_catchup[current_tenant()] = now
+    n = materialize_due_series()
+    if n:
+        app.logger.info("Recurring series: %d occurrences materialized", n)
+
+def create_series(client_id, role_id, start_dt, end_dt, vat_percent, detail, rule, sync_uuid=None):
+    """Enregistre une série (une ligne + un seul évènement récurrent Google Calendar)."""
+    rule = normalize_rule(rule, start_dt)
+    parsed = parse_rule(rule, start_dt)
+    first = parsed.after(start_dt, inc=True)
+    if first is None:
+        raise ValueError("The repeat rule produces no occurrence.")
+    # saisie a posteriori : pas plus de SERIES_MAX_COUNT jobs passés créés d'un coup
+    past = list(parsed.xafter(start_dt, count=SERIES_MAX_COUNT + 1, inc=True))
+    if len(past) > SERIES_MAX_COUNT and past[-1] < datetime.now():
+        raise ValueError(f"This series would create more than {SERIES_MAX_COUNT} past jobs; start it later.")
+    series = JobSeries(client_id=client_id, role_id=role_id, start_dt=start_dt, end_dt=end_dt, rrule=rule,
+                       vat_percent=vat_percent, detail=detail, materialized_until=0, sync_uuid=sync_uuid)
+    if "UNTIL=" in rule:
+        series.until_ts = to_epoch(rule_until(rule)) + 1  # borne sans énumérer les occurrences
+    elif "COUNT=" in rule:
+        series.until_ts = to_epoch(parsed[-1]) + 1  # au plus SERIES_MAX_COUNT occurrences
+    db.session.add(series); db.session.commit()
+
+    try:
+        ev_id = create_gcal_series_event(series)
+        if ev_id:
+            series.gcal_event_id = ev_id
+            db.session.commit()
+    except Exception:
+        pass
+
+    # saisie a posteriori : les occurrences déjà passées deviennent des jobs tout de suite
+    materialize_series(series, int(time.time()))
+    return series
+
+def end_series(series):
+    """Arrête une série maintenant : le passé reste, les occurrences futures disparaissent."""
+    now_ts = int(time.time())
+    materialize_series(series, now_ts)
+    Job.query.filter(Job.series_id == series.id, Job.start_ts >= now_ts).delete(synchronize_session=False)
+    db.session.commit()
+    if not Job.query.filter_by(series_id=series.id).count():
+        delete_gcal_event(series)
+        db.session.delete(series); db.session.commit()
+        return
+    series.until_ts = now_ts
+    try:
+        update_gcal_series_event(series, until=from_epoch(now_ts))
+    except Exception:
+        pass
+    db.session.commit()
+
 def overlaps_night(start_dt, end_dt, ns, ne):
     t = start_dt
     while t <= end_dt:
@@ -287,42 +972,29 @@ def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         s = get_settings()
-        if s.login_enabled and not session.get('user'):
+        if (MULTI_TENANT or s.login_enabled) and not session.get('user'):
             return redirect(url_for('login', next=request.path))
         return f(*args, **kwargs)
     return wrapper
 
 # ---------- Google Calendar minimal helpers ----------
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
+def gcal():
+    # import différé : la pile Google n'est chargée qu'au premier usage du calendrier
+    import gcal_helper
+    return gcal_helper
+
+def token_dir():
+    # multi-tenant : jeton Google propre à chaque utilisateur (pas de repli sur config/token.json)
+    return current_data_dir() if current_tenant() else None
 
 def credentials_path():
-    # cherche credentials.json en priorité dans data/, sinon config/
-    p1 = os.path.join(data_dir, "credentials.json")
-    p2 = os.path.join(config_dir, "credentials.json")
-    return p1 if os.path.exists(p1) else (p2 if os.path.exists(p2) else None)
+    return gcal().credentials_path(current_data_dir(), config_dir)
 
 def token_path():
-    # cherche token.json d'abord dans data/, sinon dans config/ (et retourne data/ par défaut si aucun)
-    p1 = os.path.join(data_dir, "token.json")
-    p2 = os.path.join(config_dir, "token.json")
-    if os.path.exists(p1): return p1
-    if os.path.exists(p2): return p2
-    return p1
+    return gcal().token_path(current_data_dir(), token_dir() or config_dir)
 
 def get_google_service():
-    cred_file = credentials_path()
-    if not cred_file: 
-        return None
-    creds = None
-    tok = token_path()
-    if os.path.exists(tok):
-        creds = Credentials.from_authorized_user_file(tok, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            return None
-    return build("calendar","v3", credentials=creds, cache_discovery=False)
+    return gcal().get_service(current_data_dir(), config_dir, token_dir=token_dir())
 
 def delete_gcal_event(job):
     s = get_settings()
@@ -332,7 +1004,7 @@ def delete_gcal_event(job):
     if not service: return
     cal_id = s.gcal_calendar_id or "primary"
     try:
-        service.events().delete(calendarId=cal_id, eventId=job.gcal_event_id).execute()
+        gcal().delete_event(service, cal_id, job.gcal_event_id)
     except Exception:
         pass
 
@@ -342,38 +1014,69 @@ def create_gcal_event(job: "Job"):
     service = get_google_service()
     if not service: return None
     cal_id = s.gcal_calendar_id or "primary"
-    summary = f"{job.client.name} — {job.role.name}"
-    description = job.detail or ""
-    body = {
-        "summary": summary,
-        "description": description,
-        "start": {"dateTime": job.start_dt.isoformat(), "timeZone": TIMEZONE},
-        "end": {"dateTime": job.end_dt.isoformat(), "timeZone": TIMEZONE}
-    }
-    created = service.events().insert(calendarId=cal_id, body=body).execute()
-    return created.get("id")
+    return gcal().create_event(service, cal_id, job, TIMEZONE)
+
+def google_rule(rule):
+    # Google exige UNTIL en UTC quand l'évènement a une heure : 20251231T235959 local -> ...Z
+    def utc(m):
+        local = datetime.strptime(m.group(1), "%Y%m%dT%H%M%S" if "T" in m.group(1) else "%Y%m%d")
+        return "UNTIL=" + datetime.fromtimestamp(to_epoch(local), ZoneInfo("UTC")).strftime("%Y%m%dT%H%M%SZ")
+    return "RRULE:" + re.sub(r"UNTIL=(\d{8}(?:T\d{6})?)(?![\dTZ])", utc, rule)
+
+def gcal_instance_id(event_id, start_dt):
+    # identifiant Google d'une occurrence d'un évènement récurrent : <id>_<début UTC>
+    return f"{event_id}_{datetime.fromtimestamp(to_epoch(start_dt), ZoneInfo('UTC')):%Y%m%dT%H%M%SZ}"
+
+def create_gcal_series_event(series: "JobSeries"):
+    s = get_settings()
+    if not s.gcal_enabled: return None
+    service = get_google_service()
+    if not service: return None
+    cal_id = s.gcal_calendar_id or "primary"
+    return gcal().create_event(service, cal_id, series, TIMEZONE, recurrence=[google_rule(series.rrule)])
+
+def update_gcal_series_event(series: "JobSeries", until):
+    s = get_settings()
+    if not s.gcal_enabled or not series.gcal_event_id: return
+    service = get_google_service()
+    if not service: return
+    rule = re.sub(r";?(COUNT|UNTIL)=[^;]*", "", series.rrule) + f";UNTIL={until:%Y%m%dT%H%M%S}"
+    gcal().set_recurrence(service, s.gcal_calendar_id or "primary", series.gcal_event_id, [google_rule(rule)])
 
 # ---------- Routes ----------
 @app.route('/login', methods=['GET','POST'])
 def login():
     s = get_settings()
-    if not s.login_enabled:
+    if not MULTI_TENANT and not s.login_enabled:
         return redirect(url_for('jobs'))
     error = None
     if request.method == 'POST':
         pwd = request.form.get('password','')
-        if s.login_password and pwd == s.login_password:
-            session['user'] = 'admin'
+        tenant = request.form.get('username','').strip().lower() if MULTI_TENANT else None
+        if MULTI_TENANT:
+            # le mot de passe est celui des Settings de l'utilisateur, dans sa propre base
+            if tenant_exists(tenant):
+                use_tenant(tenant); s = get_settings()
+            else:
+                s = None
+        if s and s.login_password and pwd == s.login_password:
+            session.clear()
+            session['user'] = tenant or 'admin'
+            if tenant:
+                session['tenant'] = tenant
             session.permanent = True
             nxt = request.args.get('next') or url_for('jobs')
             return redirect(nxt)
         else:
-            error = "Invalid password."
+            if MULTI_TENANT:
+                use_tenant(session.get('tenant'))
+            error = "Invalid username or password." if MULTI_TENANT else "Invalid password."
     return render_template('login.html', app_name=APP_NAME, error=error)
 
 @app.route('/logout')
 def logout():
     session.pop('user', None)
+    session.pop('tenant', None)
     return redirect(url_for('login'))
 
 @app.route('/healthz')
@@ -383,9 +1086,13 @@ def healthz():
 @app.route('/')
 @login_required
 def jobs():
-    now = datetime.now()
-    upcoming_jobs = Job.query.filter(Job.end_dt >= now).order_by(Job.start_dt.asc()).all()
-    past_jobs = Job.query.filter(Job.end_dt < now).order_by(Job.start_dt.desc()).limit(100).all()
+    now_ts = int(time.time())
+    # pas d'ORDER BY : SQLite parcourrait ix_job_start_ts en entier au lieu d'utiliser ix_job_end_ts
+    upcoming_jobs = Job.query.filter(Job.end_ts >= now_ts).all()
+    # occurrences à venir des séries, calculées pour la fenêtre affichée seulement (tri commun)
+    upcoming_jobs = sorted(upcoming_jobs + series_jobs(now_ts, now_ts + SERIES_HORIZON_DAYS * 86400),
+                           key=lambda j: j.start_ts)
+    past_jobs = Job.query.filter(Job.end_ts < now_ts).order_by(Job.start_ts.desc()).limit(100).all()
     clients = Client.query.order_by(Client.name.asc()).all()
     roles_by_client = {}
     for c in clients:
@@ -393,33 +1100,63 @@ def jobs():
             {"id": r.id, "name": r.name, "mode": r.mode, "rate": r.rate_sek}
             for r in c.roles if r.active
         ]
+    series = (JobSeries.query.filter(db.or_(JobSeries.until_ts.is_(None), JobSeries.until_ts > now_ts))
+              .order_by(JobSeries.start_dt.asc()).all())
     return render_template('jobs.html',
                            app_name=APP_NAME, today=today_str(),
-                           upcoming_jobs=upcoming_jobs, past_jobs=past_jobs,
+                           upcoming_jobs=upcoming_jobs, past_jobs=past_jobs, series=series,
+                           describe_rule=describe_rule, horizon_days=SERIES_HORIZON_DAYS,
                            clients=clients, roles_data=roles_by_client)
 
+def form_rule(form):
+    """RRULE demandée par le formulaire (champ `rrule` brut ou `repeat` + fin), None si job simple."""
+    if (form.get('rrule') or '').strip():
+        return form['rrule']
+    repeat = form.get('repeat') or 'none'
+    if repeat == 'none':
+        return None
+    if repeat not in REPEAT_RULES:
+        raise ValueError(f"Unknown repeat: {repeat}")
+    until = date.fromisoformat(form['repeat_until']) if form.get('repeat_until') else None
+    return repeat_rule(repeat, until=until, count=form.get('repeat_count') or None)
+
 @app.route('/add-job', methods=['POST'])
 @login_required
 def add_job():
-    start_dt = datetime.fromisoformat(request.form['start_dt'])
-    end_dt = datetime.fromisoformat(request.form['end_dt'])
-    client_id = int(request.form['client_id'])
-    role_id = int(request.form['role_id'])
-    vat_percent = int(request.form.get('vat_percent', DEFAULT_VAT_PERCENT))
-    detail = request.form.get('detail','').strip()
-
-    flags = []
-    if Holiday.query.filter_by(date=start_dt.date()).first():
-        flags.append("holiday")
+    fields = dict(client_id=int(request.form['client_id']),
+                  role_id=int(request.form['role_id']),
+                  start_dt=datetime.fromisoformat(request.form['start_dt']),
+                  end_dt=datetime.fromisoformat(request.form['end_dt']),
+                  vat_percent=int(request.form.get('vat_percent', DEFAULT_VAT_PERCENT)),
+                  detail=request.form.get('detail','').strip())
+    # uuid envoyé par offline.js : un POST rejoué (ou déjà reçu via /api/sync) n'est pas doublé
+    fields['sync_uuid'] = (request.form.get('uuid') or '').strip()[:64] or None
+    if synced_entry(fields['sync_uuid']):
+        return redirect(url_for('jobs'))
+    try:
+        rule = form_rule(request.form)
+        if rule:
+            create_series(rule=rule, **fields)
+        else:
+            create_job(**fields)
+    except ValueError as e:
+        abort(400, description=str(e))
+    return redirect(url_for('jobs'))
+
+def synced_entry(uuid):
+    # job ou série déjà enregistré sous cet uuid (saisie hors ligne)
+    if not uuid:
+        return None
+    return Job.query.filter_by(sync_uuid=uuid).first() or JobSeries.query.filter_by(sync_uuid=uuid).first()
+
+def create_job(client_id, role_id, start_dt, end_dt, vat_percent, detail, sync_uuid=None):
+    """Crée un job (drapeaux jour férié/nuit + évènement Google Calendar si activé)."""
     s = get_settings()
-    ns, ne = s.night_start_hour, s.night_end_hour
-    if overlaps_night(start_dt, end_dt, ns, ne):
-        flags.append("night hours")
-    if flags:
-        detail = (detail + " " if detail else "") + "(" + " & ".join(flags) + ")"
+    detail = flagged_detail(detail, holiday_on(start_dt.date()),
+                            overlaps_night(start_dt, end_dt, s.night_start_hour, s.night_end_hour))
 
     job = Job(client_id=client_id, role_id=role_id, start_dt=start_dt, end_dt=end_dt,
-              vat_percent=vat_percent, detail=detail)
+              vat_percent=vat_percent, detail=detail, sync_uuid=sync_uuid)
     db.session.add(job); db.session.commit()
 
     try:
@@ -430,7 +1167,7 @@ def add_job():
     except Exception:
         pass
 
-    return redirect(url_for('jobs'))
+    return job
 
 @app.route('/jobs/<int:job_id>/delete', methods=['POST'])
 @login_required
@@ -444,33 +1181,44 @@ def delete_job(job_id):
     db.session.commit()
     return redirect(url_for('jobs'))
 
+@app.route('/series/<int:series_id>/materialize', methods=['POST'])
+@login_required
+def materialize_series_view(series_id):
+    series = JobSeries.query.get_or_404(series_id)
+    until = date.fromisoformat(request.form['until'])
+    t0 = time.perf_counter()
+    n = materialize_series(series, to_epoch(datetime.combine(until + timedelta(days=1), datetime.min.time())))
+    app.logger.info("Series %d: %d occurrences materialized in %.2fs", series.id, n, time.perf_counter() - t0)
+    return redirect(url_for('jobs'))
+
+@app.route('/series/<int:series_id>/end', methods=['POST'])
+@login_required
+def end_series_view(series_id):
+    end_series(JobSeries.query.get_or_404(series_id))
+    return redirect(url_for('jobs'))
+
 @app.route('/monthly')
 @login_required
 def monthly_summary():
     year = int(request.args.get('year', datetime.now().year))
     month = int(request.args.get('month', datetime.now().month))
-    start, end = month_bounds(year, month)
-    jobs_q = Job.query.filter(Job.start_dt >= start, Job.start_dt < end).all()
+    by_client = month_jobs_by_client(year, month)
+    jobs_q = [j for items in by_client.values() for j in items]
     s = get_settings()
     net_factor = (s.net_rate_percent or 63.0)/100.0
     total_ht = sum(j.amount_sek for j in jobs_q)
-    total_vat_amt = sum(((j.role.vat_percent if j.role and j.role.vat_percent is not None else j.vat_percent)/100.0) * j.amount_sek for j in jobs_q)
+    total_vat_amt = sum((job_vat_percent(j)/100.0) * j.amount_sek for j in jobs_q)
     total_gross = total_ht + total_vat_amt
     total_net = total_ht * net_factor
     # Annual total excl VAT
-    ystart = datetime(year,1,1)
-    yend = datetime(year+1,1,1)
-    jobs_year = Job.query.filter(Job.start_dt >= ystart, Job.start_dt < yend).all()
+    jobs_year = jobs_in_range(to_epoch(datetime(year,1,1)), to_epoch(datetime(year+1,1,1)))
     year_total_ht = sum(j.amount_sek for j in jobs_year)
 
-    by_client = {}
-    for j in jobs_q:
-        by_client.setdefault(j.client_id, []).append(j)
     client_cards = []
     for cid, items in by_client.items():
         client = items[0].client
         ht = sum(i.amount_sek for i in items)
-        vat_amt = sum(((i.role.vat_percent if i.role and i.role.vat_percent is not None else i.vat_percent)/100.0)*i.amount_sek for i in items)
+        vat_amt = sum((job_vat_percent(i)/100.0)*i.amount_sek for i in items)
         gross = ht + vat_amt
         net = ht * net_factor
         status = get_invoice_status(cid, year, month)
@@ -483,7 +1231,7 @@ def monthly_summary():
     now = datetime.now()
     return render_template('monthly.html', app_name=APP_NAME, today=today_str(),
                            year=year, month=month, current_year=now.year, current_month=now.month,
-                           month_label=f"{['','January','February','March','April','May','June','July','August','September','October','November','December'][month]} {year}", year_total_ht=year_total_ht,
+                           month_label=f"{MONTH_NAMES[month]} {year}", year_total_ht=year_total_ht,
                            net_rate_str=f"{(s.net_rate_percent or 63):.2f}%",
                            totals={"total_ht": total_ht, "total_gross": total_gross, "total_net": total_net},
                            client_cards=client_cards,
@@ -497,7 +1245,9 @@ def toggle_invoice():
     year = int(request.form['year']); month = int(request.form['month'])
     field = request.form['field']
     status = get_invoice_status(cid, year, month)
-    if field == 'sent': status.sent = not status.sent
+    if field == 'sent':
+        status.sent = not status.sent
+        status.sent_on = date.today() if status.sent else None
     if field == 'paid': status.paid = not status.paid
     db.session.commit()
     return ('', 204)
@@ -513,6 +1263,31 @@ def set_invoice_number():
     db.session.commit()
     return ('', 204)
 
+@app.route('/invoice/pdf')
+@login_required
+def invoice_pdf_view():
+    cid = int(request.args['client_id'])
+    year = int(request.args['year']); month = int(request.args['month'])
+    items = month_jobs_by_client(year, month).get(cid)
+    if not items:
+        abort(404)
+    inv = invoice_payload(items[0].client, items, year, month)
+    paths, _ = invoice_pdf.generate_invoices(data_subdir("invoices"), [inv])
+    return send_file(paths[0], mimetype='application/pdf',
+                     download_name=f"invoice-{year}-{month:02d}-{cid}.pdf")
+
+@app.route('/invoices/generate', methods=['POST'])
+@login_required
+def generate_month_invoices():
+    year = int(request.form['year']); month = int(request.form['month'])
+    invs = [invoice_payload(items[0].client, items, year, month)
+            for items in month_jobs_by_client(year, month).values()]
+    t0 = time.perf_counter()
+    paths, rendered = invoice_pdf.generate_invoices(data_subdir("invoices"), invs, max_workers=INVOICE_WORKERS)
+    app.logger.info("Invoices %d-%02d: %d rendered, %d cached in %.2fs",
+                    year, month, rendered, len(paths) - rendered, time.perf_counter() - t0)
+    return redirect(url_for('monthly_summary', year=year, month=month))
+
 @app.route('/clients')
 @login_required
 def clients_roles():
@@ -624,7 +1399,18 @@ def settings_view():
         db.session.commit()
         return redirect(url_for('settings_view'))
     holidays = Holiday.query.order_by(Holiday.date.asc()).all()
-    return render_template('settings.html', app_name=APP_NAME, today=today_str(), settings=s, holidays=holidays)
+    current_year = datetime.now().year
+    job_year_rows = JobYear.query.filter(db.or_(JobYear.job_count > 0, JobYear.archived_count > 0)).order_by(JobYear.year.desc()).all()
+    backups = [(os.path.basename(p), os.path.getsize(p)) for p in backup.list_backups(data_subdir("backups"))[:5]]
+    return render_template('settings.html', app_name=APP_NAME, today=today_str(), settings=s, holidays=holidays, backups=backups, current_year=current_year,
+                           job_years=job_year_rows, archive_msg=request.args.get('archive_msg'))
+
+@app.route('/settings/backup', methods=['POST'])
+@login_required
+def settings_backup():
+    report = backup.backup(current_db_path(), data_subdir("backups"))
+    app.logger.info("Backup %s", backup.format_report(report))
+    return redirect(url_for('settings_view'))
 
 # === NOUVELLE ROUTE : test connexion Google Calendar ===
 @app.route('/settings/test-gcal', methods=['POST'])
@@ -637,16 +1423,8 @@ def settings_test_gcal():
         service = get_google_service()
         if not service:
             return jsonify({"ok": False, "msg": "No valid Google token/credentials."}), 400
-        start = datetime.now() + timedelta(minutes=2)
-        end   = start + timedelta(minutes=15)
-        ev = {
-            "summary": "ALR Test (from Settings)",
-            "description": "Connectivity test from Settings",
-            "start": {"dateTime": start.isoformat(), "timeZone": TIMEZONE},
-            "end":   {"dateTime": end.isoformat(),   "timeZone": TIMEZONE},
-        }
-        created = service.events().insert(calendarId=s.gcal_calendar_id, body=ev).execute()
-        return jsonify({"ok": True, "eventId": created.get("id")})
+        event_id = gcal().test_event(service, s.gcal_calendar_id, TIMEZONE)
+        return jsonify({"ok": True, "eventId": event_id})
     except Exception as e:
         try:
             app.logger.exception("GCal test failed: %s", e)
@@ -654,12 +1432,30 @@ def settings_test_gcal():
             pass
         return jsonify({"ok": False, "msg": str(e)}), 500
 
+@app.route('/settings/archive/<int:year>', methods=['POST'], endpoint='settings_archive_year')
+@login_required
+def settings_archive_year(year):
+    try:
+        if request.form.get('action') == 'restore':
+            n = unarchive_year(year)
+            msg = f"{year}: {n} jobs restored from archive."
+        else:
+            n = archive_year(year)
+            msg = f"{year}: {n} jobs archived."
+    except ValueError as e:
+        msg = str(e)
+    except sqlite3.Error as e:
+        app.logger.exception("Archive %d failed", year)
+        msg = f"{year}: archive operation failed ({e})."
+    app.logger.info("Archive: %s", msg)
+    return redirect(url_for('settings_view', archive_msg=msg))
+
 @app.route('/settings/upload-credentials', methods=['POST'], endpoint='upload_credentials')
 @login_required
 def upload_credentials():
     f = request.files.get('credentials')
     if f and f.filename.endswith('.json'):
-        f.save(os.path.join(data_dir, "credentials.json"))
+        f.save(os.path.join(current_data_dir(), "credentials.json"))
     return redirect(url_for('settings_view'))
 
 # Holidays CRUD
@@ -671,6 +1467,19 @@ def settings_holiday_add():
     sur = request.form.get('surcharge_text','').strip()
     h = Holiday(date=d, name=name, surcharge_text=sur)
     db.session.add(h); db.session.commit()
+    invalidate_holiday_cache()
+    return redirect(url_for('settings_view'))
+
+@app.route('/settings/holiday/generate', methods=['POST'], endpoint='settings_generate_holidays')
+@login_required
+def settings_holiday_generate():
+    year_from = int(request.form.get('year_from', datetime.now().year))
+    year_to = int(request.form.get('year_to', year_from))
+    if year_to < year_from:
+        year_from, year_to = year_to, year_from
+    year_to = min(year_to, year_from + 99)
+    n = upsert_holidays(holidays_se.swedish_holidays_between(year_from, year_to))
+    app.logger.info("Generated %d Swedish holidays for %d-%d", n, year_from, year_to)
     return redirect(url_for('settings_view'))
 
 @app.route('/settings/holiday/<int:holiday_id>/update', methods=['POST'], endpoint='settings_update_holiday')
@@ -681,6 +1490,7 @@ def settings_holiday_update(holiday_id):
     h.name = request.form['name']
     h.surcharge_text = request.form.get('surcharge_text','').strip()
     db.session.commit()
+    invalidate_holiday_cache()
     return redirect(url_for('settings_view'))
 
 @app.route('/settings/holiday/<int:holiday_id>/delete', methods=['POST'], endpoint='settings_delete_holiday')
@@ -688,6 +1498,7 @@ def settings_holiday_update(holiday_id):
 def settings_holiday_delete(holiday_id):
     h = Holiday.query.get_or_404(holiday_id)
     db.session.delete(h); db.session.commit()
+    invalidate_holiday_cache()
     return redirect(url_for('settings_view'))
 
 # Minimal Google Calendar endpoints to avoid 404s
@@ -702,7 +1513,7 @@ def gcal_connect():
 @login_required
 def gcal_disconnect():
     try:
-        os.remove(os.path.join(data_dir, "token.json"))
+        os.remove(os.path.join(current_data_dir(), "token.json"))
     except Exception:
         pass
     return redirect(url_for('settings_view'))
@@ -714,9 +1525,7 @@ def gcal_create_calendar():
     service = get_google_service()
     if service:
         try:
-            cal = {"summary":"Freelancer Admin App", "timeZone": TIMEZONE}
-            created = service.calendars().insert(body=cal).execute()
-            s.gcal_calendar_id = created.get('id')
+            s.gcal_calendar_id = gcal().create_calendar(service, "Freelancer Admin App", TIMEZONE)
             db.session.commit()
         except Exception:
             pass
@@ -734,7 +1543,7 @@ def calendar_view():
 def api_stats(year):
     months = list(range(1,13))
     buckets = { m: [] for m in months }
-    jobs_year = Job.query.filter(db.extract('year', Job.start_dt)==year).all()
+    jobs_year = jobs_in_range(to_epoch(datetime(year,1,1)), to_epoch(datetime(year+1,1,1)))
     for j in jobs_year:
         buckets[j.start_dt.month].append(j)
     clients_all = sorted({ j.client.name for j in jobs_year })
@@ -793,16 +1602,13 @@ def api_stats(year):
 @login_required
 def statistics():
     # years present in DB (fallback current year)
-    years = sorted({ datetime.now().year })
-    all_jobs = Job.query.all()
-    if all_jobs:
-        years = sorted({ j.start_dt.year for j in all_jobs })
+    years = job_years() or [datetime.now().year]
     year = int(request.args.get('year', datetime.now().year))
 
     # Totals to display
     s = get_settings()
     net_factor = (s.net_rate_percent or 63.0)/100.0
-    jobs_year = [j for j in all_jobs if j.start_dt.year == year]
+    jobs_year = jobs_in_range(to_epoch(datetime(year,1,1)), to_epoch(datetime(year+1,1,1)))
     total_hours = round(sum(j.duration_hours for j in jobs_year))
     total_jobs = len(jobs_year)
     total_revenue_net = round(sum(j.amount_sek for j in jobs_year) * net_factor)
@@ -811,6 +1617,243 @@ def statistics():
                            years=years, year=year,
                            totals={"hours_year": total_hours, "jobs_year": total_jobs, "revenue_year": total_revenue_net})
 
+# ---------- Receivables ----------
+AGING_BUCKETS = [(30, "0-30"), (60, "31-60"), (90, "61-90"), (None, "90+")]
+
+# Montants par (client, mois clos) non payés, calculés en SQL avec les mêmes règles que Job.amount_sek.
+# Le mois en cours n'est pas encore facturable : il est exclu.
+RECEIVABLES_SQL = """
+WITH lines AS (
+    SELECT job.client_id AS client_id,
+           CAST(strftime('%Y', job.start_dt) AS INTEGER) AS year,
+           CAST(strftime('%m', job.start_dt) AS INTEGER) AS month,
+           CASE role.mode
+               WHEN 'hourly' THEN role.rate_sek * MAX(0, job.end_ts - job.start_ts) / 3600.0
+               WHEN 'daily' THEN role.rate_sek * MAX(0, CAST(julianday(date(job.end_dt)) - julianday(date(job.start_dt)) AS INTEGER) + 1)
+               WHEN 'weekly' THEN role.rate_sek * ((MAX(0, CAST(julianday(date(job.end_dt)) - julianday(date(job.start_dt)) AS INTEGER) + 1) + 6) / 7)
+               ELSE role.rate_sek
+           END AS ht,
+           COALESCE(role.vat_percent, job.vat_percent) AS vat_percent
+    FROM job JOIN role ON role.id = job.role_id
+    WHERE job.start_ts < :month_start_ts
+)
+SELECT lines.client_id, client.name, lines.year, lines.month,
+       SUM(lines.ht) AS ht, SUM(lines.ht * lines.vat_percent / 100.0) AS vat,
+       COALESCE(inv.sent, 0) AS sent, inv.sent_on, inv.invoice_number
+FROM lines
+JOIN client ON client.id = lines.client_id
+LEFT JOIN invoice_status inv
+       ON inv.client_id = lines.client_id AND inv.year = lines.year AND inv.month = lines.month
+WHERE COALESCE(inv.paid, 0) = 0
+GROUP BY lines.client_id, lines.year, lines.month
+ORDER BY client.name, lines.year, lines.month
+"""
+
+def aging_bucket(age_days):
+    for limit, label in AGING_BUCKETS:
+        if limit is None or age_days <= limit:
+            return label
+
+def receivables(as_of=None):
+    """Factures envoyées non payées par client, âgées depuis l'envoi ; mois clos jamais facturés à part."""
+    as_of = as_of or date.today()
+    month_start = to_epoch(datetime(as_of.year, as_of.month, 1))
+    rows = db.session.execute(db.text(RECEIVABLES_SQL), {"month_start_ts": month_start}).all()
+    labels = [label for _, label in AGING_BUCKETS]
+    clients, totals = {}, {label: 0.0 for label in labels}
+    not_invoiced = 0.0
+    for cid, name, year, month, ht, vat, sent, sent_on, number in rows:
+        gross = (ht or 0.0) + (vat or 0.0)
+        c = clients.setdefault(cid, {"client_id": cid, "client": name, "total": 0.0, "not_invoiced": 0.0,
+                                     "buckets": {label: 0.0 for label in labels}, "invoices": []})
+        inv = {"year": year, "month": month, "period": f"{MONTH_NAMES[month]} {year}",
+               "invoice_number": number, "sent": bool(sent), "ht": round(ht or 0.0, 2),
+               "gross": round(gross, 2), "age_days": None, "bucket": None}
+        if sent:
+            # factures marquées envoyées avant l'ajout de sent_on : fin du mois facturé
+            sent_from = date.fromisoformat(str(sent_on)) if sent_on else date(year, month, 1) + relativedelta(months=1)
+            inv["age_days"] = max(0, (as_of - sent_from).days)
+            inv["bucket"] = aging_bucket(inv["age_days"])
+            c["buckets"][inv["bucket"]] += gross
+            c["total"] += gross
+            totals[inv["bucket"]] += gross
+        else:
+            c["not_invoiced"] += gross
+            not_invoiced += gross
+        c["invoices"].append(inv)
+    ordered = sorted(clients.values(), key=lambda c: (c["total"], c["not_invoiced"]), reverse=True)
+    return {"as_of": as_of.isoformat(), "buckets": labels, "clients": ordered,
+            "totals": totals, "total": sum(totals.values()), "not_invoiced": not_invoiced}
+
+@app.route('/receivables')
+@login_required
+def receivables_view():
+    return render_template('receivables.html', app_name=APP_NAME, today=today_str(), data=receivables())
+
+@app.route('/api/receivables')
+@login_required
+def api_receivables():
+    data = receivables()
+    data["currency"] = get_settings().currency_code or 'SEK'
+    return jsonify(data)
+
+# ---------- Search ----------
+def fts_query(q):
+    # chaque mot devient une requête préfixe : "venue" -> "venue"*
+    terms = re.findall(r"\w+", q or "", re.UNICODE)
+    return " ".join('"%s"*' % t for t in terms)
+
+def search_jobs(q, date_from=None, date_to=None, limit=50):
+    """Jobs correspondant à `q` (FTS5, classés par pertinence), filtrés par date de début."""
+    match = fts_query(q)
+    where, params = [], {"limit": limit}
+    if date_from:
+        where.append("start_ts >= :date_from"); params["date_from"] = to_epoch(datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        where.append("start_ts < :date_to"); params["date_to"] = to_epoch(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if match:
+        # job_fts seul : il couvre aussi les années archivées
+        params["q"] = match
+        sql = ("SELECT rowid FROM job_fts WHERE job_fts MATCH :q "
+               + "".join(" AND job_fts." + w for w in where) + " ORDER BY rank LIMIT :limit")
+    elif where:
+        sql = "SELECT id FROM job WHERE " + " AND ".join(where) + " ORDER BY start_ts DESC LIMIT :limit"
+    else:
+        return []
+    ids = [row[0] for row in db.session.execute(db.text(sql), params)]
+    if not match:
+        # recherche par dates seules : années archivées de la plage en plus
+        lo, hi = params.get("date_from", 0), params.get("date_to", to_epoch(datetime(9999, 1, 1)))
+        archived = [j for y in archived_years_between(max(lo, 0), hi) for j in archived_jobs(y, lo, hi)]
+        if archived:
+            jobs = {j.id: j for j in Job.query.filter(Job.id.in_(ids)).all()} if ids else {}
+            merged = sorted(list(jobs.values()) + archived, key=lambda j: j.start_ts, reverse=True)
+            return merged[:limit]
+    if not ids:
+        return []
+    by_id = {j.id: j for j in Job.query.filter(Job.id.in_(ids)).all()}
+    missing = [i for i in ids if i not in by_id]
+    if missing:
+        by_id.update(archived_jobs_by_id(missing))
+    return [by_id[i] for i in ids if i in by_id]
+
+def search_args():
+    q = request.args.get('q', '').strip()
+    def parse_date(name):
+        try:
+            return date.fromisoformat(request.args.get(name, ''))
+        except ValueError:
+            return None
+    return q, parse_date('from'), parse_date('to')
+
+@app.route('/search')
+@login_required
+def search():
+    q, date_from, date_to = search_args()
+    results = search_jobs(q, date_from, date_to, limit=100)
+    return render_template('search.html', app_name=APP_NAME, today=today_str(), q=q,
+                           date_from=date_from, date_to=date_to, results=results)
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    q, date_from, date_to = search_args()
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))  # valeur invalide -> 50
+    return jsonify([{
+        "id": j.id, "start": j.start_dt.isoformat(), "end": j.end_dt.isoformat(),
+        "client": j.client.name if j.client else None, "role": j.role.name if j.role else None,
+        "detail": j.detail, "amount": round(j.amount_sek, 2),
+    } for j in search_jobs(q, date_from, date_to, limit=limit)])
+
+# ---------- Delta sync (PWA) ----------
+SYNC_PAGE_SIZE = 500
+SYNC_INITIAL_JOB_DAYS = 60  # nouvel appareil : jobs récents et à venir seulement, pas tout l'historique
+
+def sync_row(entity, obj):
+    if entity == 'client':
+        return {"id": obj.id, "name": obj.name, "default_vat_percent": obj.default_vat_percent}
+    if entity == 'role':
+        return {"id": obj.id, "client_id": obj.client_id, "name": obj.name, "mode": obj.mode,
+                "rate": obj.rate_sek, "vat_percent": obj.vat_percent, "active": bool(obj.active)}
+    return {"id": obj.id, "client_id": obj.client_id, "role_id": obj.role_id,
+            "start": obj.start_dt.isoformat(timespec='minutes'), "end": obj.end_dt.isoformat(timespec='minutes'),
+            "vat_percent": obj.vat_percent, "detail": obj.detail, "uuid": obj.sync_uuid}
+
+@app.route('/api/sync', methods=['GET'])
+@login_required
+def api_sync():
+    """Modifications depuis `since` (curseur = seq du change_log), par pages."""
+    since = request.args.get('since', 0, type=int)  # curseur invalide -> synchro initiale
+    if since <= 0:
+        return jsonify(sync_snapshot())
+    changes = (ChangeLog.query.filter(ChangeLog.seq > since)
+               .order_by(ChangeLog.seq.asc()).limit(SYNC_PAGE_SIZE + 1).all())
+    has_more = len(changes) > SYNC_PAGE_SIZE
+    changes = changes[:SYNC_PAGE_SIZE]
+    models = {'client': Client, 'role': Role, 'job': Job}
+    wanted = {e: [c.entity_id for c in changes if c.entity == e and c.op == 'upsert'] for e in models}
+    loaded = {e: {o.id: o for o in models[e].query.filter(models[e].id.in_(ids)).all()} if ids else {}
+              for e, ids in wanted.items()}
+    out = {e + 's': [] for e in models}
+    deleted = {e + 's': [] for e in models}
+    for c in changes:
+        obj = loaded.get(c.entity, {}).get(c.entity_id)
+        if c.op == 'upsert' and obj is not None:
+            out[c.entity + 's'].append(sync_row(c.entity, obj))
+        elif c.op == 'delete':
+            deleted[c.entity + 's'].append(c.entity_id)
+    return jsonify({"cursor": changes[-1].seq if changes else since, "has_more": has_more,
+                    "upserts": out, "deletes": deleted})
+
+def sync_snapshot():
+    # synchro initiale : clients et rôles complets, jobs récents, curseur placé en fin de change_log
+    cursor = db.session.query(db.func.max(ChangeLog.seq)).scalar() or 0
+    cutoff = to_epoch(datetime.now() - timedelta(days=SYNC_INITIAL_JOB_DAYS))
+    jobs = Job.query.filter(Job.end_ts >= cutoff).order_by(Job.start_ts.asc()).all()
+    return {"cursor": cursor, "has_more": False,
+            "upserts": {"clients": [sync_row('client', c) for c in Client.query.order_by(Client.id).all()],
+                        "roles": [sync_row('role', r) for r in Role.query.order_by(Role.id).all()],
+                        "jobs": [sync_row('job', j) for j in jobs]},
+            "deletes": {"clients": [], "roles": [], "jobs": []}}
+
+@app.route('/api/sync', methods=['POST'])
+@login_required
+def api_sync_push():
+    """Reçoit les jobs saisis hors ligne ; rejouer la même file est sans effet (uuid)."""
+    payload = request.get_json(silent=True) or {}
+    results = []
+    for item in payload.get('jobs', []):
+        uuid = str(item.get('uuid') or '').strip()[:64] or None
+        existing = synced_entry(uuid)
+        if existing:
+            key = "series_id" if isinstance(existing, JobSeries) else "id"
+            results.append({"uuid": uuid, key: existing.id, "created": False})
+            continue
+        try:
+            fields = dict(client_id=int(item['client_id']), role_id=int(item['role_id']),
+                          start_dt=datetime.fromisoformat(item['start_dt']),
+                          end_dt=datetime.fromisoformat(item['end_dt']),
+                          vat_percent=int(item.get('vat_percent') or DEFAULT_VAT_PERCENT),
+                          detail=(item.get('detail') or '').strip(), sync_uuid=uuid)
+            rule = form_rule(item)
+            if rule:
+                series = create_series(rule=rule, **fields)
+                results.append({"uuid": uuid, "series_id": series.id, "created": True})
+            else:
+                job = create_job(**fields)
+                results.append({"uuid": uuid, "id": job.id, "created": True})
+        except (KeyError, ValueError, TypeError) as e:
+            db.session.rollback()
+            results.append({"uuid": uuid, "error": str(e)})
+    return jsonify({"results": results})
+
+@app.route('/sw.js')
+def service_worker():
+    # servi depuis la racine pour que le service worker contrôle toute l'application
+    resp = send_file(os.path.join(app.static_folder, 'sw.js'), mimetype='application/javascript')
+    resp.headers['Service-Worker-Allowed'] = '/'
+    return resp
+
 @app.route('/api/holiday')
 @login_required
 def api_holiday():
@@ -819,8 +1862,8 @@ def api_holiday():
         dt = datetime.fromisoformat(d)
     except Exception:
         return jsonify({"is_holiday": False})
-    h = Holiday.query.filter_by(date=dt.date()).first()
-    return jsonify({"is_holiday": bool(h), "name": (h.name if h else None), "surcharge_text": (h.surcharge_text if h else None)})
+    h = holiday_on(dt.date())
+    return jsonify({"is_holiday": bool(h), "name": (h[0] if h else None), "surcharge_text": (h[1] if h else None)})
 
 @app.route('/api/settings')
 @login_required
@@ -838,6 +1881,34 @@ def no_cache(resp):
     resp.headers['Expires'] = '0'
     return resp
 
+@app.cli.command('create-tenant')
+@click.argument('name')
+@click.password_option(help="Login password of the new user.")
+@click.option('--import-db', type=click.Path(exists=True, dir_okay=False),
+              help="Existing freelancer.sqlite3 to start from (e.g. a former single-user container).")
+def create_tenant(name, password, import_db):
+    """Crée l'espace d'un utilisateur (mode MULTI_TENANT=1)."""
+    if not MULTI_TENANT:
+        raise click.UsageError("Set MULTI_TENANT=1 to manage tenants.")
+    name = name.strip().lower()
+    if not TENANT_RE.match(name):
+        raise click.BadParameter("use lowercase letters, digits, '-' or '_' (max 40).", param_hint='NAME')
+    if tenant_exists(name):
+        raise click.UsageError(f"Tenant {name!r} already exists.")
+    os.makedirs(os.path.dirname(tenant_db_path(name)), exist_ok=True)
+    if import_db:
+        src, dst = sqlite3.connect(import_db), sqlite3.connect(tenant_db_path(name))
+        try:
+            src.backup(dst)
+        finally:
+            dst.close(); src.close()
+    use_tenant(name)
+    s = get_settings()  # crée la base (schéma + migrations) et la ligne Settings si besoin
+    s.login_password = password
+    s.login_enabled = True
+    db.session.commit()
+    click.echo(f"Tenant {name!r} ready: {tenant_db_path(name)}")
+
 if __name__ == '__main__':
     if not os.path.exists(db_path):
         open(db_path, 'a').close()
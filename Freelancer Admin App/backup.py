@@ -0,0 +1,200 @@
+# backup.py — sauvegardes à chaud de la base SQLite (API backup de sqlite3)
+#
+#   python backup.py backup [--pages 256] [--keep 14]
+#   python backup.py list
+#   python backup.py restore data/backups/freelancer-20250101-030000.sqlite3.gz
+#   python backup.py schedule --every 24h
+#   python backup.py --all-tenants schedule --every 24h     # MULTI_TENANT=1 : chaque utilisateur
+#   python backup.py --tenant alice restore data/tenants/alice/backups/freelancer-....sqlite3.gz
+#
+# La copie avance par paquets de pages (`--pages`) avec une courte pause entre
+# chaque paquet : les écritures de gunicorn ne sont jamais bloquées longtemps.
+# Si la base est modifiée pendant la copie, SQLite la reprend automatiquement,
+# l'instantané obtenu est donc toujours cohérent.
+import os, re, sys, gzip, time, shutil, sqlite3, argparse
+from datetime import datetime
+from urllib.request import pathname2url
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("DB_PATH") or os.path.join(APP_ROOT, "instance", "freelancer.sqlite3")
+BACKUP_DIR = os.getenv("BACKUP_DIR") or os.path.join(APP_ROOT, "data", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+TENANTS_DIR = os.getenv("TENANTS_DIR") or os.path.join(APP_ROOT, "data", "tenants")
+PREFIX = "freelancer-"
+SUFFIX = ".sqlite3.gz"
+
+
+def list_backups(out_dir=BACKUP_DIR):
+    """Sauvegardes existantes, de la plus récente à la plus ancienne."""
+    if not os.path.isdir(out_dir):
+        return []
+    names = [n for n in os.listdir(out_dir) if n.startswith(PREFIX) and n.endswith(SUFFIX)]
+    return [os.path.join(out_dir, n) for n in sorted(names, reverse=True)]
+
+def rotate(out_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    removed = []
+    for path in list_backups(out_dir)[keep:]:
+        os.remove(path); removed.append(path)
+    return removed
+
+def _step_copy(src, dst, pages, sleep):
+    steps = [0]
+    def progress(status, remaining, total):
+        steps[0] += 1
+        # sqlite3 ne dort qu'en cas de BUSY/LOCKED : la pause entre paquets est faite ici,
+        # ce qui laisse les écrivains prendre le verrou entre deux paquets
+        if remaining and sleep:
+            time.sleep(sleep)
+    src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+    return steps[0]
+
+def backup(db_path=DB_PATH, out_dir=BACKUP_DIR, pages=256, sleep=0.005, keep=BACKUP_KEEP, tag=""):
+    """Instantané compressé de `db_path` ; retourne un rapport (chemin, tailles, durées)."""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"{PREFIX}{stamp}{'-' + tag if tag else ''}"
+    tmp = os.path.join(out_dir, f".{name}.sqlite3.tmp")
+    final = os.path.join(out_dir, name + SUFFIX)
+
+    t0 = time.perf_counter()
+    src = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(tmp)
+    try:
+        page_size = src.execute("PRAGMA page_size").fetchone()[0]
+        steps = _step_copy(src, dst, pages, sleep)
+        n_pages = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close(); src.close()
+    t1 = time.perf_counter()
+    try:
+        with open(tmp, "rb") as fin, gzip.open(final + ".part", "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        os.replace(final + ".part", final)
+        db_bytes = os.path.getsize(tmp)
+    finally:
+        os.remove(tmp)
+    t2 = time.perf_counter()
+    return {
+        "path": final, "pages": n_pages, "page_size": page_size, "steps": steps,
+        "bytes_db": db_bytes, "bytes_gz": os.path.getsize(final),
+        "seconds_copy": round(t1 - t0, 3), "seconds_compress": round(t2 - t1, 3),
+        "removed": rotate(out_dir, keep),
+    }
+
+def restore(archive, db_path=DB_PATH, out_dir=BACKUP_DIR, pages=256):
+    """Restaure `archive` dans la base (via l'API backup, la base reste ouverte par l'app).
+
+    Un instantané « pre-restore » de la base courante est pris au préalable.
+    """
+    tmp = os.path.join(os.path.dirname(os.path.abspath(db_path)), ".restore.sqlite3.tmp")
+    with gzip.open(archive, "rb") as fin, open(tmp, "wb") as fout:
+        shutil.copyfileobj(fin, fout, 1024 * 1024)
+    try:
+        src = sqlite3.connect(tmp)
+        try:
+            check = src.execute("PRAGMA integrity_check").fetchone()[0]
+            if check != "ok":
+                raise ValueError(f"{archive}: integrity check failed ({check})")
+            safety = backup(db_path, out_dir, keep=sys.maxsize, tag="pre-restore") if os.path.exists(db_path) else None
+            t0 = time.perf_counter()
+            dst = sqlite3.connect(db_path, timeout=30)
+            try:
+                src.backup(dst, pages=pages)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    finally:
+        os.remove(tmp)
+    return {"restored": archive, "pre_restore": safety and safety["path"],
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+def tenant_target(name, tenants_dir=TENANTS_DIR):
+    # même organisation que app.py : data/tenants/<nom>/freelancer.sqlite3 et .../backups/
+    root = os.path.join(tenants_dir, name)
+    return name, os.path.join(root, "freelancer.sqlite3"), os.path.join(root, "backups")
+
+def tenant_targets(tenants_dir=TENANTS_DIR):
+    """(nom, base, dossier de sauvegarde) de chaque utilisateur du mode multi-tenant."""
+    if not os.path.isdir(tenants_dir):
+        return []
+    targets = [tenant_target(n, tenants_dir) for n in sorted(os.listdir(tenants_dir))]
+    return [t for t in targets if os.path.isfile(t[1])]
+
+def parse_interval(text):
+    m = re.fullmatch(r"(\d+)\s*([smhd]?)", text.strip())
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid interval: {text!r} (e.g. 30m, 6h, 1d)")
+    return int(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2)]
+
+def format_report(r):
+    mb = 1024 * 1024
+    return (f"{r['path']}: {r['bytes_db'] / mb:.1f} MB -> {r['bytes_gz'] / mb:.1f} MB gz, "
+            f"{r['pages']} pages in {r['steps']} steps, copy {r['seconds_copy']:.2f}s, "
+            f"compress {r['seconds_compress']:.2f}s"
+            + (f", rotated {len(r['removed'])}" if r["removed"] else ""))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Online SQLite backups for the Freelancer Admin App")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--dir", default=BACKUP_DIR)
+    who = ap.add_mutually_exclusive_group()
+    who.add_argument("--tenant", help="one user of a MULTI_TENANT deployment")
+    who.add_argument("--all-tenants", action="store_true",
+                     help="every user of a MULTI_TENANT deployment, each into its own backups/ folder")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("backup", "schedule"):
+        p = sub.add_parser(name)
+        p.add_argument("--pages", type=int, default=256, help="pages copied per step")
+        p.add_argument("--sleep", type=float, default=0.005, help="pause between steps (s)")
+        p.add_argument("--keep", type=int, default=BACKUP_KEEP, help="snapshots to keep")
+        if name == "schedule":
+            p.add_argument("--every", type=parse_interval, default="24h")
+    p = sub.add_parser("restore")
+    p.add_argument("archive")
+    sub.add_parser("list")
+    args = ap.parse_args(argv)
+    if args.all_tenants and args.cmd == "restore":
+        ap.error("restore needs a single database: use --tenant NAME")
+    if args.tenant:
+        target = tenant_target(args.tenant)
+        if not os.path.isfile(target[1]):
+            ap.error(f"no database for tenant {args.tenant!r} ({target[1]})")
+
+    def targets():
+        # relu à chaque passage de `schedule` : les nouveaux utilisateurs sont pris en compte
+        if args.all_tenants:
+            return tenant_targets()
+        if args.tenant:
+            return [tenant_target(args.tenant)]
+        return [(None, args.db, args.dir)]
+
+    def run_backups():
+        failed = 0
+        for name, db_path, out_dir in targets():
+            label = f"[{name}] " if name else ""
+            try:
+                print(label + format_report(backup(db_path, out_dir, args.pages, args.sleep, args.keep)), flush=True)
+            except Exception as e:
+                failed += 1
+                print(f"{label}backup failed: {e}", file=sys.stderr, flush=True)
+        return failed
+
+    if args.cmd == "list":
+        for name, _, out_dir in targets():
+            for path in list_backups(out_dir):
+                st = os.stat(path)
+                print(f"{path}  {st.st_size / 1024:.0f} KB")
+    elif args.cmd == "backup":
+        sys.exit(1 if run_backups() else 0)
+    elif args.cmd == "restore":
+        _, db_path, out_dir = targets()[0]
+        r = restore(args.archive, db_path, out_dir)
+        print(f"restored {r['restored']} in {r['seconds']:.2f}s (previous database saved to {r['pre_restore']})")
+    elif args.cmd == "schedule":
+        while True:
+            run_backups()
+            time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
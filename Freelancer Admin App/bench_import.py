@@ -0,0 +1,65 @@
+# bench_import.py — mesure le coût d'import de app.py (démarrage d'un worker gunicorn)
+#
+#   python bench_import.py              # 5 mesures, affiche la médiane et les modules les plus lents
+#   python bench_import.py --runs 10 --top 20
+#
+# Chaque mesure lance `python -X importtime -c "import app"` dans une copie
+# temporaire de l'application (base SQLite vierge), pour ne jamais toucher aux
+# données réelles.
+import os, re, sys, shutil, argparse, tempfile, statistics, subprocess
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def copy_app(dest):
+    shutil.copytree(APP_ROOT, dest, ignore=shutil.ignore_patterns(
+        "data", "config", "instance", "__pycache__", "*.sqlite3", "*.pdf"))
+
+def run_once(workdir, module):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=workdir, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            self_us, cumul_us, indent, name = m.groups()
+            rows.append((name, int(self_us), int(cumul_us), len(indent) // 2))
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description="Import-time benchmark (python -X importtime)")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--module", default="app")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = os.path.join(tmp, "app")
+        copy_app(workdir)
+        run_once(workdir, args.module)  # préchauffage (.pyc, base créée)
+        runs = [run_once(workdir, args.module) for _ in range(args.runs)]
+
+    totals = [sum(r[1] for r in rows) for rows in runs]
+    target = [max((r[2] for r in rows if r[0] == args.module), default=0) for rows in runs]
+    print(f"import {args.module}: median {statistics.median(target) / 1000:.1f} ms "
+          f"(min {min(target) / 1000:.1f}, max {max(target) / 1000:.1f}) over {args.runs} runs")
+    print(f"all imports (incl. interpreter startup): median {statistics.median(totals) / 1000:.1f} ms")
+
+    # imports directs du module mesuré, regroupés par package racine et triés par cumul
+    last = runs[-1]
+    top_level = {}
+    for name, _, cumul, depth in last:
+        root = name.split(".")[0]
+        if depth == 1:
+            top_level[root] = top_level.get(root, 0) + cumul
+    print(f"\nslowest packages imported by {args.module} (last run):")
+    for root, cumul in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"  {cumul / 1000:8.1f} ms  {root}")
+
+    google = sorted({name for name, *_ in last if name.split(".")[0] in ("google", "googleapiclient", "google_auth_oauthlib")})
+    print(f"\nGoogle modules loaded at import: {len(google)}" + (f" ({', '.join(google[:5])}...)" if google else ""))
+
+if __name__ == "__main__":
+    main()
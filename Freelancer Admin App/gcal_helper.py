@@ -1,62 +1,84 @@
-# gcal_helper.py — minimal, ne touche pas à ta DB
-import os, json
-import pytz
+# gcal_helper.py — intégration Google Calendar, ne touche pas à ta DB
+# Importé à la demande par app.py ; la pile Google (lente à importer) n'est
+# chargée qu'au premier appel réel de _google().
+import os
 from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-
-TZ = "Europe/Stockholm"
-
-def _load_gcal_service(app_root):
-    token_path = os.path.join(app_root, "config", "token.json")
-    with open(token_path, "r", encoding="utf-8") as f:
-        t = json.load(f)
-    creds = Credentials(
-        token=t.get("token"),
-        refresh_token=t.get("refresh_token"),
-        token_uri=t.get("token_uri", "https://oauth2.googleapis.com/token"),
-        client_id=t.get("client_id"),
-        client_secret=t.get("client_secret"),
-        scopes=t.get("scopes") or ["https://www.googleapis.com/auth/calendar"],
-    )
-    if not creds.valid:
-        creds.refresh(Request())
-    return build("calendar", "v3", credentials=creds, cache_discovery=False)
+from functools import lru_cache
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
-def create_gcal_event(app_root, calendar_id, job, client_name, role_name):
-    """job.start_dt/end_dt doivent être des datetime (tz naïf) ou strings '%Y-%m-%d %H:%M'."""
-    service = _load_gcal_service(app_root)
-    tz = pytz.timezone(TZ)
+@lru_cache(maxsize=1)
+def _google():
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+    from google.auth.transport.requests import Request
+    return Credentials, build, Request
 
-    def to_dt(x):
-        if isinstance(x, datetime):
-            return x
-        return datetime.strptime(x, "%Y-%m-%d %H:%M")
+def credentials_path(data_dir, config_dir):
+    # cherche credentials.json en priorité dans data/, sinon config/
+    p1 = os.path.join(data_dir, "credentials.json")
+    p2 = os.path.join(config_dir, "credentials.json")
+    return p1 if os.path.exists(p1) else (p2 if os.path.exists(p2) else None)
 
-    sdt = tz.localize(to_dt(job.start_dt))
-    edt = tz.localize(to_dt(job.end_dt))
+def token_path(data_dir, config_dir):
+    # cherche token.json d'abord dans data/, sinon dans config/ (et retourne data/ par défaut si aucun)
+    p1 = os.path.join(data_dir, "token.json")
+    p2 = os.path.join(config_dir, "token.json")
+    if os.path.exists(p1): return p1
+    if os.path.exists(p2): return p2
+    return p1
+
+def get_service(data_dir, config_dir, token_dir=None):
+    # token_dir : dossier imposé pour token.json (un jeton par utilisateur en multi-tenant)
+    if not credentials_path(data_dir, config_dir):
+        return None
+    try:
+        Credentials, build, Request = _google()
+    except ImportError:
+        return None
+    creds = None
+    tok = token_path(token_dir, token_dir) if token_dir else token_path(data_dir, config_dir)
+    if os.path.exists(tok):
+        creds = Credentials.from_authorized_user_file(tok, SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            return None
+    return build("calendar", "v3", credentials=creds, cache_discovery=False)
 
+def create_event(service, calendar_id, job, timezone, recurrence=None):
     body = {
-        "summary": f"{client_name} - {role_name}",
-        "description": (job.detail or "").strip(),
-        "start": {"dateTime": sdt.isoformat(), "timeZone": TZ},
-        "end":   {"dateTime": edt.isoformat(), "timeZone": TZ},
+        "summary": f"{job.client.name} — {job.role.name}",
+        "description": job.detail or "",
+        "start": {"dateTime": job.start_dt.isoformat(), "timeZone": timezone},
+        "end": {"dateTime": job.end_dt.isoformat(), "timeZone": timezone}
     }
-    ev = service.events().insert(calendarId=calendar_id, body=body).execute()
-    return ev.get("id")
+    if recurrence:
+        # série : un seul évènement récurrent (ex. ["RRULE:FREQ=WEEKLY;COUNT=12"])
+        body["recurrence"] = recurrence
+    created = service.events().insert(calendarId=calendar_id, body=body).execute()
+    return created.get("id")
 
-def test_gcal_create(app_root, calendar_id):
+def set_recurrence(service, calendar_id, event_id, recurrence):
+    service.events().patch(calendarId=calendar_id, eventId=event_id, body={"recurrence": recurrence}).execute()
+
+def delete_event(service, calendar_id, event_id):
+    service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+
+def test_event(service, calendar_id, timezone):
     """Crée un petit évènement test dans 2 minutes."""
-    service = _load_gcal_service(app_root)
-    tz = pytz.timezone(TZ)
-    start = tz.localize(datetime.now() + timedelta(minutes=2))
-    end   = tz.localize(datetime.now() + timedelta(minutes=17))
+    start = datetime.now() + timedelta(minutes=2)
+    end   = start + timedelta(minutes=15)
     ev = {
         "summary": "ALR Test (from Settings)",
         "description": "Connectivity test from Settings",
-        "start": {"dateTime": start.isoformat(), "timeZone": TZ},
-        "end":   {"dateTime": end.isoformat(), "timeZone": TZ},
+        "start": {"dateTime": start.isoformat(), "timeZone": timezone},
+        "end":   {"dateTime": end.isoformat(),   "timeZone": timezone},
     }
     created = service.events().insert(calendarId=calendar_id, body=ev).execute()
-    return created.get("id")
\ No newline at end of file
+    return created.get("id")
+
+def create_calendar(service, summary, timezone):
+    created = service.calendars().insert(body={"summary": summary, "timeZone": timezone}).execute()
+    return created.get("id")
@@ -0,0 +1,55 @@
+# holidays_se.py — jours fériés suédois calculés (aucune saisie manuelle nécessaire)
+# Fêtes mobiles dérivées de Pâques (dateutil.easter), Midsommar et Alla helgons
+# calculés selon leur règle calendaire. Les veilles (afton) sont incluses car
+# elles sont chômées de fait et majorées dans la plupart des conventions.
+from datetime import date, timedelta
+from dateutil.easter import easter
+
+FRIDAY, SATURDAY = 4, 5
+
+def _first_weekday_from(d, weekday):
+    return d + timedelta(days=(weekday - d.weekday()) % 7)
+
+def swedish_holidays(year):
+    """Liste triée de (date, nom) pour une année."""
+    e = easter(year)
+    midsummer_eve = _first_weekday_from(date(year, 6, 19), FRIDAY)      # vendredi 19–25 juin
+    all_saints = _first_weekday_from(date(year, 10, 31), SATURDAY)      # samedi 31 oct – 6 nov
+    days = [
+        (date(year, 1, 1), "New Year's Day"),
+        (date(year, 1, 6), "Epiphany"),
+        (e - timedelta(days=2), "Good Friday"),
+        (e - timedelta(days=1), "Easter Eve"),
+        (e, "Easter Sunday"),
+        (e + timedelta(days=1), "Easter Monday"),
+        (date(year, 5, 1), "May Day"),
+        (e + timedelta(days=39), "Ascension Day"),
+        (e + timedelta(days=48), "Whitsun Eve"),
+        (e + timedelta(days=49), "Whit Sunday"),
+        (midsummer_eve, "Midsummer Eve"),
+        (midsummer_eve + timedelta(days=1), "Midsummer Day"),
+        (all_saints, "All Saints' Day"),
+        (date(year, 12, 24), "Christmas Eve"),
+        (date(year, 12, 25), "Christmas Day"),
+        (date(year, 12, 26), "Boxing Day"),
+        (date(year, 12, 31), "New Year's Eve"),
+    ]
+    # 2005 : le lundi de Pentecôte est remplacé par la fête nationale
+    if year >= 2005:
+        days.append((date(year, 6, 6), "National Day of Sweden"))
+    else:
+        days.append((e + timedelta(days=50), "Whit Monday"))
+    return merge_same_day(days)
+
+def merge_same_day(days):
+    """Une entrée par date : Ascension et 1er mai en 2008 -> "Ascension Day / May Day"."""
+    names = {}
+    for d, name in days:
+        names.setdefault(d, [])
+        if name not in names[d]:
+            names[d].append(name)
+    return [(d, " / ".join(sorted(names[d]))) for d in sorted(names)]
+
+def swedish_holidays_between(year_from, year_to):
+    for y in range(year_from, year_to + 1):
+        yield from swedish_holidays(y)
@@ -0,0 +1,216 @@
+# invoice_pdf.py — factures PDF sans dépendance externe (polices standard Helvetica)
+# Ce module n'importe pas app.py : il doit rester léger pour les workers du pool.
+import os, json, hashlib, unicodedata
+from functools import lru_cache
+
+RENDERER_VERSION = 1            # à incrémenter si la mise en page change (invalide le cache)
+PAGE_W, PAGE_H = 595, 842       # A4 en points
+MARGIN = 50
+ROWS_PER_PAGE = 32
+POOL_MIN_BATCH = 100            # en dessous, démarrer le pool coûte plus que le rendu (~0,6 ms/facture)
+
+# Largeurs AFM (1/1000 em) des caractères ASCII 32..126
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+FONTS = {"F1": ("Helvetica", _HELVETICA), "F2": ("Helvetica-Bold", _HELVETICA_BOLD)}
+
+
+@lru_cache(maxsize=1024)
+def char_width(font, ch):
+    widths = FONTS[font][1]
+    o = ord(ch)
+    if 32 <= o <= 126:
+        return widths[o - 32]
+    # å, ä, ö, é... : on prend la largeur de la lettre de base
+    base = unicodedata.normalize("NFD", ch)[:1]
+    if base and 32 <= ord(base) <= 126:
+        return widths[ord(base) - 32]
+    return 556
+
+@lru_cache(maxsize=4096)
+def text_width(font, size, text):
+    return sum(char_width(font, c) for c in text) * size / 1000.0
+
+def fmt_money(v):
+    # même rendu que le filtre Jinja fmt_money de app.py
+    return f"{int(round(float(v or 0))):,.0f}".replace(",", " ")
+
+def _pdf_str(text):
+    raw = str(text).encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def _text(font, size, x, y, text):
+    return b"BT /%s %d Tf %.2f %.2f Td %s Tj ET\n" % (font.encode(), size, x, y, _pdf_str(text))
+
+def _text_right(font, size, x_right, y, text):
+    return _text(font, size, x_right - text_width(font, size, str(text)), y, text)
+
+def _fit(font, size, text, max_w):
+    text = str(text or "")
+    if text_width(font, size, text) <= max_w:
+        return text
+    while text and text_width(font, size, text + "...") > max_w:
+        text = text[:-1]
+    return text + "..."
+
+
+# ---------- Templates (mis en cache) ----------
+@lru_cache(maxsize=1)
+def _font_objects():
+    return [b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % name.encode()
+            for name, _ in FONTS.values()]
+
+@lru_cache(maxsize=32)
+def _page_header(company, currency):
+    out = _text("F2", 18, MARGIN, PAGE_H - 60, company)
+    out += _text_right("F2", 18, PAGE_W - MARGIN, PAGE_H - 60, "INVOICE")
+    out += b"0.8 G %d %d m %d %d l S 0 G\n" % (MARGIN, PAGE_H - 72, PAGE_W - MARGIN, PAGE_H - 72)
+    y = PAGE_H - 200
+    cols = [(MARGIN, "Date"), (MARGIN + 75, "Role"), (MARGIN + 215, "Detail")]
+    for x, label in cols:
+        out += _text("F2", 9, x, y, label)
+    out += _text_right("F2", 9, PAGE_W - MARGIN - 90, y, "Qty")
+    out += _text_right("F2", 9, PAGE_W - MARGIN, y, f"Amount ({currency})")
+    out += b"0.8 G %d %d m %d %d l S 0 G\n" % (MARGIN, y - 5, PAGE_W - MARGIN, y - 5)
+    return out
+
+
+def _qty_label(line):
+    mode = line.get("mode")
+    if mode == "hourly":
+        return f"{line['hours']:.1f} h"
+    if mode == "daily":
+        return f"{line['days']} d"
+    if mode == "weekly":
+        return f"{line['weeks']} w"
+    return "1"
+
+def _page_content(inv, lines, page_no, page_count, last):
+    out = _page_header(inv["company"], inv["currency"])
+    y = PAGE_H - 100
+    out += _text("F1", 10, MARGIN, y, "Bill to:")
+    out += _text("F2", 12, MARGIN, y - 16, inv["client"])
+    meta = [
+        ("Invoice #", inv.get("invoice_number") or "-"),
+        ("Period", inv["period"]),
+        ("Date", inv["issued"]),
+    ]
+    for i, (label, value) in enumerate(meta):
+        yy = y - 16 * i
+        out += _text_right("F1", 10, PAGE_W - MARGIN - 110, yy, label)
+        out += _text_right("F2", 10, PAGE_W - MARGIN, yy, value)
+
+    y = PAGE_H - 220
+    for line in lines:
+        out += _text("F1", 9, MARGIN, y, line["date"])
+        out += _text("F1", 9, MARGIN + 75, y, _fit("F1", 9, line["role"], 135))
+        out += _text("F1", 9, MARGIN + 215, y, _fit("F1", 9, line["detail"], 150))
+        out += _text_right("F1", 9, PAGE_W - MARGIN - 90, y, _qty_label(line))
+        out += _text_right("F1", 9, PAGE_W - MARGIN, y, fmt_money(line["amount"]))
+        y -= 16
+
+    if last:
+        y -= 10
+        out += b"0.8 G %d %.2f m %d %.2f l S 0 G\n" % (PAGE_W - MARGIN - 220, y + 12, PAGE_W - MARGIN, y + 12)
+        for label, value, font in [
+            ("Total (excl. VAT)", inv["ht"], "F1"),
+            ("VAT", inv["vat"], "F1"),
+            ("Invoice Amount (incl. VAT)", inv["gross"], "F2"),
+        ]:
+            out += _text_right(font, 10, PAGE_W - MARGIN - 110, y, label)
+            out += _text_right(font, 10, PAGE_W - MARGIN, y, f"{fmt_money(value)} {inv['currency']}")
+            y -= 16
+    out += _text_right("F1", 8, PAGE_W - MARGIN, 30, f"Page {page_no}/{page_count}")
+    return out
+
+
+def render_invoice(inv):
+    """Retourne le PDF (bytes) d'une facture. `inv` est un dict simple (picklable)."""
+    lines = inv.get("lines") or []
+    pages = [lines[i:i + ROWS_PER_PAGE] for i in range(0, len(lines), ROWS_PER_PAGE)] or [[]]
+
+    # 1 Catalog, 2 Pages, 3.. polices, puis (page, contenu) par page
+    fonts = _font_objects()
+    first_page = 3 + len(fonts)
+    kids = [first_page + 2 * i for i in range(len(pages))]
+    font_refs = b" ".join(b"/%s %d 0 R" % (name.encode(), 3 + i) for i, name in enumerate(FONTS))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(pages)),
+        *fonts,
+    ]
+    for i, chunk in enumerate(pages):
+        stream = _page_content(inv, chunk, i + 1, len(pages), i == len(pages) - 1)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> /Contents %d 0 R >>"
+                       % (PAGE_W, PAGE_H, font_refs, kids[i] + 1))
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    buf = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for n, obj in enumerate(objects, start=1):
+        offsets.append(len(buf))
+        buf += b"%d 0 obj\n%s\nendobj\n" % (n, obj)
+    xref = len(buf)
+    buf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        buf += b"%010d 00000 n \n" % off
+    buf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(buf)
+
+
+# ---------- Cache disque + génération par lot ----------
+def fingerprint(inv):
+    # la date d'émission ne doit pas invalider le cache à elle seule
+    payload = {k: v for k, v in inv.items() if k != "issued"}
+    payload["_v"] = RENDERER_VERSION
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def invoice_path(out_dir, inv):
+    return os.path.join(out_dir, f"{inv['year']}-{inv['month']:02d}", f"invoice-{inv['client_id']}.pdf")
+
+def is_fresh(out_dir, inv):
+    pdf = invoice_path(out_dir, inv)
+    try:
+        with open(pdf + ".sha256", "r", encoding="utf-8") as f:
+            return f.read().strip() == fingerprint(inv) and os.path.exists(pdf)
+    except OSError:
+        return False
+
+def write_invoice(out_dir, inv):
+    pdf = invoice_path(out_dir, inv)
+    os.makedirs(os.path.dirname(pdf), exist_ok=True)
+    data = render_invoice(inv)
+    tmp = f"{pdf}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, pdf)
+    with open(pdf + ".sha256", "w", encoding="utf-8") as f:
+        f.write(fingerprint(inv))
+    return pdf
+
+def generate_invoices(out_dir, invoices, max_workers=None):
+    """Génère les PDF manquants ou périmés ; retourne (chemins, nb régénérés)."""
+    stale = [inv for inv in invoices if not is_fresh(out_dir, inv)]
+    workers = max(1, min(len(stale), max_workers or os.cpu_count() or 1))
+    if workers > 1 and len(stale) >= POOL_MIN_BATCH:
+        from concurrent.futures import ProcessPoolExecutor  # différé : inutile au démarrage des workers
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(write_invoice, [out_dir] * len(stale), stale, chunksize=max(1, len(stale) // (4 * workers))))
+    else:
+        for inv in stale:
+            write_invoice(out_dir, inv)
+    return [invoice_path(out_dir, inv) for inv in invoices], len(stale)
@@ -0,0 +1,177 @@
+// offline.js — file IndexedDB des jobs saisis hors ligne + synchronisation différentielle (/api/sync)
+(function () {
+  const DB_NAME = 'freelancer-sync', DB_VERSION = 1;
+
+  function openDb() {
+    return new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB_NAME, DB_VERSION);
+      req.onupgradeneeded = () => {
+        const db = req.result;
+        db.createObjectStore('queue', { keyPath: 'uuid' });     // jobs à envoyer
+        db.createObjectStore('entities', { keyPath: 'key' });   // 'client:1', 'role:3', 'job:42'
+        db.createObjectStore('meta', { keyPath: 'name' });      // curseur de synchro
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  function tx(db, stores, mode, fn) {
+    return new Promise((resolve, reject) => {
+      const t = db.transaction(stores, mode);
+      const result = fn(t);
+      t.oncomplete = () => resolve(result);
+      t.onerror = () => reject(t.error);
+    });
+  }
+
+  function getAll(store) {
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const req = db.transaction(store).objectStore(store).getAll();
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    }));
+  }
+
+  function uuid() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return 'j-' + Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+  }
+
+  function queueJob(form, id) {
+    const data = Object.fromEntries(new FormData(form).entries());
+    data.uuid = id || uuid();
+    data.queued_at = new Date().toISOString();
+    return openDb().then((db) => tx(db, ['queue'], 'readwrite', (t) => t.objectStore('queue').put(data)));
+  }
+
+  // envoie la file ; les uuid rendent l'envoi rejouable sans doublons
+  async function flushQueue() {
+    const pending = await getAll('queue');
+    if (!pending.length) return 0;
+    const resp = await fetch('/api/sync', {
+      method: 'POST', headers: { 'Content-Type': 'application/json' }, credentials: 'same-origin',
+      body: JSON.stringify({ jobs: pending })
+    });
+    const body = await resp.json();
+    // rejetés par le serveur (données invalides) : retirés de la file, l'utilisateur est prévenu
+    const rejected = body.results.filter((r) => r.error);
+    if (rejected.length) alert('Some offline jobs could not be saved:\n' + rejected.map((r) => r.error).join('\n'));
+    const done = body.results.map((r) => r.uuid);
+    const db = await openDb();
+    await tx(db, ['queue'], 'readwrite', (t) => done.forEach((u) => t.objectStore('queue').delete(u)));
+    return done.length;
+  }
+
+  // récupère uniquement ce qui a changé depuis le dernier curseur
+  async function pullChanges() {
+    const db = await openDb();
+    const meta = await new Promise((resolve) => {
+      const req = db.transaction('meta').objectStore('meta').get('cursor');
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => resolve(null);
+    });
+    // sans curseur, since=0 renvoie un instantané (clients, rôles, jobs récents) et le curseur courant
+    let cursor = meta ? meta.value : 0, more = true, applied = 0;
+    while (more) {
+      const resp = await fetch('/api/sync?since=' + cursor, { credentials: 'same-origin' });
+      const page = await resp.json();
+      await tx(db, ['entities', 'meta'], 'readwrite', (t) => {
+        const store = t.objectStore('entities');
+        Object.entries(page.upserts).forEach(([kind, rows]) => rows.forEach((row) => {
+          store.put(Object.assign({ key: kind.slice(0, -1) + ':' + row.id }, row)); applied++;
+        }));
+        Object.entries(page.deletes).forEach(([kind, ids]) => ids.forEach((id) => {
+          store.delete(kind.slice(0, -1) + ':' + id); applied++;
+        }));
+        t.objectStore('meta').put({ name: 'cursor', value: page.cursor });
+      });
+      cursor = page.cursor; more = page.has_more;
+    }
+    return applied;
+  }
+
+  // rôles actifs par client depuis la copie locale (utile si la page vient du cache)
+  async function rolesByClient() {
+    const rows = await getAll('entities');
+    const out = {};
+    rows.filter((r) => r.key.startsWith('role:') && r.active).forEach((r) => {
+      (out[String(r.client_id)] = out[String(r.client_id)] || []).push({ id: r.id, name: r.name, mode: r.mode, rate: r.rate });
+    });
+    return out;
+  }
+
+  function showPending(n) {
+    const el = document.getElementById('syncStatus');
+    if (!el) return;
+    el.style.display = n ? 'inline-block' : 'none';
+    el.textContent = n + ' job' + (n > 1 ? 's' : '') + ' waiting to sync';
+  }
+
+  async function sync() {
+    if (!navigator.onLine) { showPending((await getAll('queue')).length); return; }
+    try {
+      const sent = await flushQueue();  // nb de jobs traités par le serveur
+      await pullChanges();
+      const left = (await getAll('queue')).length;
+      showPending(left);
+      if (sent && !left) window.location.reload();
+    } catch (e) {
+      showPending((await getAll('queue')).length);
+    }
+  }
+
+  window.FreelancerOffline = { queueJob, flushQueue, pullChanges, rolesByClient, sync };
+
+  if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/sw.js', { scope: '/' }).catch(() => {});
+  }
+  window.addEventListener('online', sync);
+  window.addEventListener('load', sync);
+
+  const SUBMIT_TIMEOUT_MS = 10000;
+
+  function errorText(html) {
+    const doc = new DOMParser().parseFromString(html, 'text/html');
+    const p = doc.querySelector('p');
+    return (p ? p.textContent : doc.body.textContent).trim();
+  }
+
+  // formulaire Jobs : envoyé en fetch ; si le réseau échoue (hors ligne, connexion faible,
+  // délai dépassé, serveur injoignable) la saisie part dans la file au lieu d'être perdue.
+  // Le même uuid accompagne le POST et la file : un envoi arrivé malgré le délai n'est pas doublé.
+  document.addEventListener('submit', async (ev) => {
+    const form = ev.target;
+    if (form.id !== 'jobForm') return;
+    ev.preventDefault();
+    const id = uuid();
+    let resp = null;
+    if (navigator.onLine) {
+      const body = new FormData(form);
+      body.append('uuid', id);
+      const ctrl = new AbortController();
+      const timer = setTimeout(() => ctrl.abort(), SUBMIT_TIMEOUT_MS);
+      try {
+        resp = await fetch(form.action, { method: 'POST', body, credentials: 'same-origin', signal: ctrl.signal });
+      } catch (e) {
+        resp = null;
+      } finally {
+        clearTimeout(timer);
+      }
+    }
+    const loggedOut = resp && new URL(resp.url).pathname.startsWith('/login');
+    if (resp && resp.ok && !loggedOut) {
+      window.location.assign(resp.url);  // page Jobs renvoyée par la redirection du serveur
+      return;
+    }
+    if (resp && resp.status >= 400 && resp.status < 500) {
+      // saisie refusée (ex. règle de répétition invalide) : réessayer ne servirait à rien
+      alert('The job could not be saved: ' + errorText(await resp.text()));
+      return;
+    }
+    await queueJob(form, id);
+    form.reset();
+    if (typeof closeModal === 'function') closeModal();
+    showPending((await getAll('queue')).length);
+  });
+})();
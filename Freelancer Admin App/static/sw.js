@@ -0,0 +1,47 @@
+// sw.js — service worker : coquille de l'app en cache, saisie des jobs hors ligne
+const CACHE = 'freelancer-shell-v1';
+const SHELL = ['/', '/static/style.css', '/static/offline.js', '/static/logo.svg', '/static/manifest.webmanifest'];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(caches.open(CACHE).then((c) => c.addAll(SHELL)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((k) => k !== CACHE).map((k) => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const req = event.request;
+  const url = new URL(req.url);
+  if (req.method !== 'GET' || url.origin !== location.origin || url.pathname.startsWith('/api/')) return;
+
+  if (req.mode === 'navigate') {
+    // réseau d'abord ; hors ligne on retombe sur la dernière page Jobs connue
+    event.respondWith(
+      fetch(req).then((resp) => {
+        if (resp.ok && url.pathname === '/') {
+          const copy = resp.clone();
+          caches.open(CACHE).then((c) => c.put('/', copy));
+        }
+        return resp;
+      }).catch(() => caches.match(req).then((r) => r || caches.match('/')))
+    );
+    return;
+  }
+
+  if (url.pathname.startsWith('/static/')) {
+    event.respondWith(
+      caches.match(req).then((cached) => {
+        const network = fetch(req).then((resp) => {
+          if (resp.ok) { const copy = resp.clone(); caches.open(CACHE).then((c) => c.put(req, copy)); }
+          return resp;
+        }).catch(() => cached);
+        return cached || network;
+      })
+    );
+  }
+});